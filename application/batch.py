@@ -0,0 +1,190 @@
+# batch.py
+
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import recfile
+import passes
+
+# Fields every event needs before the player can compile it
+REQUIRED = {
+    ('mouse', 'move'): ('x', 'y'),
+    ('mouse', 'click'): ('x', 'y', 'button', 'pressed'),
+    ('mouse', 'scroll'): ('x', 'y', 'dx', 'dy'),
+    ('keyboard', 'press'): ('key',),
+    ('keyboard', 'release'): ('key',),
+}
+
+def find_recordings(paths):
+    # Files as given, directories searched recursively for .rec files
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            for root, _, names in os.walk(path):
+                files.extend(os.path.join(root, name) for name in sorted(names) if name.endswith('.rec'))
+        else:
+            files.append(path)
+    return files
+
+
+def use_backend(fake):
+    # Checking names needs pynput's Key and Button but no controllers. Where
+    # pynput cannot be imported (not installed, or no display to connect to)
+    # names are checked against the stand-ins. Returns the backend used.
+    if not fake:
+        try:
+            import pynput
+            return 'pynput'
+        except Exception:
+            pass
+    import fakeinput
+    fakeinput.install()
+    return 'fakeinput'
+
+
+def init_worker(fake):
+    use_backend(fake)
+
+
+def invalid_names(events):
+    # Recorded key and button names the player cannot resolve, with counts
+    from player import resolve_key, resolve_button
+
+    invalid = Counter()
+    for event in events:
+        if event['type'] == 'keyboard':
+            if resolve_key(event['key']) is None:
+                invalid[event['key']] += 1
+        elif event['action'] == 'click' and resolve_button(event['button']) is None:
+            invalid[event['button']] += 1
+    return invalid
+
+
+def check_events(events):
+    # Structural problems as (index, message), stopping early on a broken file
+    problems = []
+    last = None
+    for index, event in enumerate(events):
+        fields = REQUIRED.get((event.get('type'), event.get('action')))
+        if fields is None:
+            problems.append((index, f"unknown event {event.get('type')!r}/{event.get('action')!r}"))
+        elif 'time' not in event or any(field not in event for field in fields):
+            missing = [field for field in ('time',) + fields if field not in event]
+            problems.append((index, f"missing {', '.join(missing)}"))
+        elif last is not None and event['time'] < last:
+            problems.append((index, "time goes backwards"))
+        else:
+            last = event['time']
+        if len(problems) >= 100:
+            problems.append((index, "too many problems, stopped checking"))
+            break
+    return problems
+
+
+def classify_key(key):
+    # Why the player cannot resolve a recorded key or button name
+    from pynput import keyboard
+
+    if key is None:
+        return "no name (key code without a character)"
+    if isinstance(key, str) and key.startswith('Key.'):
+        return "str() fallback from the recorder"
+    if isinstance(key, str) and key in keyboard.Key.__members__:
+        return "not in player.SPECIAL_KEY_NAMES"
+    return "unknown"
+
+
+def process(source, destination=None, format='binary', coalesce=False, simplify=None):
+    # Validate one recording and optionally write it out converted. Runs in
+    # a worker process and returns a small, picklable result.
+    started = time.perf_counter()
+    result = {'file': source, 'events': 0, 'problems': [], 'invalid': {}, 'written': None}
+    try:
+        events = recfile.load(source)
+    except Exception as e:
+        result['error'] = f"cannot read: {e}"
+        return result
+    try:
+        # Loop blocks are checked as the events they stand for
+        flat = list(recfile.expand_loops(events)) if recfile.has_loops(events) else events
+        result['events'] = len(flat)
+        result['problems'] = check_events(flat)
+        if result['problems']:
+            return result
+
+        result['invalid'] = invalid_names(flat)
+
+        if destination is not None:
+            output = events
+            if coalesce:
+                output = list(passes.coalesce(flat))
+            if simplify is not None:
+                output, _ = passes.simplify_moves(output, simplify)
+            os.makedirs(os.path.dirname(destination) or '.', exist_ok=True)
+            recfile.save(destination, output, format)
+            result['written'] = len(output)
+    except Exception as e:
+        result['error'] = str(e)
+    finally:
+        if isinstance(events, recfile.Recording):
+            events.close()
+        result['seconds'] = time.perf_counter() - started
+    return result
+
+
+def run_pool(jobs, workers, fake, results):
+    # Results go to `results`; returns (job, exception) for jobs that failed
+    failed = []
+    with ProcessPoolExecutor(workers, initializer=init_worker, initargs=(fake,)) as executor:
+        futures = {executor.submit(process, *job): job for job in jobs}
+        for future in as_completed(futures):
+            try:
+                results.append(future.result())
+            except Exception as e:
+                failed.append((futures[future], e))
+    return failed
+
+
+def run(files, output=None, format='binary', coalesce=False, simplify=None, workers=None, fake=False):
+    # Fan the files out over a process pool, largest first so one big file
+    # does not start last, and collect a summary report. With `output`,
+    # converted copies are written there, mirroring the source tree.
+    files = sorted(files, key=lambda name: os.path.getsize(name) if os.path.exists(name) else 0, reverse=True)
+    root = os.path.commonpath([os.path.abspath(name) for name in files]) if files else ''
+    if len(files) == 1:
+        root = os.path.dirname(root)
+    backend = use_backend(fake)
+    jobs = []
+    for source in files:
+        destination = None
+        if output is not None:
+            destination = os.path.join(output, os.path.relpath(os.path.abspath(source), root))
+        jobs.append((source, destination, format, coalesce, simplify))
+    started = time.perf_counter()
+    results = []
+    # A worker that dies breaks the pool and every file still in it. Those
+    # files are retried in a pool each, so only the one that kills its
+    # worker is reported as failed.
+    for job, _ in run_pool(jobs, workers, fake, results):
+        for _, error in run_pool([job], 1, fake, results):
+            results.append({'file': job[0], 'events': 0, 'problems': [], 'invalid': {}, 'written': None,
+                            'error': f"worker failed: {error!r}"})
+    elapsed = time.perf_counter() - started
+
+    invalid = Counter()
+    for result in results:
+        invalid.update(result['invalid'])
+    results.sort(key=lambda result: result['file'])
+    return {
+        'files': len(results),
+        'events': sum(result['events'] for result in results),
+        'seconds': elapsed,
+        'workers': workers or os.cpu_count(),
+        'names_checked_with': backend,
+        'failed': [result['file'] for result in results if result.get('error') or result['problems']],
+        'with_invalid_keys': [result['file'] for result in results if result['invalid']],
+        'invalid_keys': [{'key': key, 'events': n, 'reason': classify_key(key)} for key, n in invalid.most_common()],
+        'results': results,
+    }
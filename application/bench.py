@@ -0,0 +1,311 @@
+# bench.py
+
+import argparse
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import fakeinput
+
+# Always benchmark against the stand-in controllers: this runs headless and
+# never moves the real mouse
+fakeinput.install()
+
+from pynput import mouse, keyboard
+
+import recfile
+from player import Player
+from recorder import Recorder
+
+KEYS = 'abcdefghijklmnopqrstuvwxyz0123456789'
+
+
+def synthetic(n, rate=1000.0, seed=0):
+    # Mostly mouse moves, like a real recording, with click pairs, scrolls
+    # and key press/release pairs mixed in. Yields exactly n events.
+    rng = random.Random(seed)
+    t = 1.7e9
+    step = 1.0 / rate
+    x, y = 960, 540
+    count = 0
+    while count < n:
+        t += step
+        roll = rng.random()
+        if roll < 0.9 or n - count < 2:
+            x = min(max(x + rng.randint(-8, 8), 0), 1919)
+            y = min(max(y + rng.randint(-8, 8), 0), 1079)
+            yield {'type': 'mouse', 'action': 'move', 'x': x, 'y': y, 'time': t}
+            count += 1
+        elif roll < 0.94:
+            yield {'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': 'left', 'pressed': True, 'time': t}
+            yield {'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': 'left', 'pressed': False, 'time': t + step / 2}
+            count += 2
+        elif roll < 0.96:
+            yield {'type': 'mouse', 'action': 'scroll', 'x': x, 'y': y, 'dx': 0, 'dy': rng.choice((-1, 1)), 'time': t}
+            count += 1
+        else:
+            key = rng.choice(KEYS)
+            yield {'type': 'keyboard', 'action': 'press', 'key': key, 'time': t}
+            yield {'type': 'keyboard', 'action': 'release', 'key': key, 'time': t + step / 2}
+            count += 2
+
+
+def measure(func, memory=True):
+    # Time one run of func, then optionally repeat it under tracemalloc for
+    # the peak of Python allocations
+    gc.collect()
+    start = time.perf_counter()
+    result = func()
+    seconds = time.perf_counter() - start
+    peak = None
+    if memory:
+        result = None
+        gc.collect()
+        tracemalloc.start()
+        func()
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, seconds, peak
+
+
+class LegacyRecorder:
+    # The dict-per-event callbacks the recorder used before the ring buffer,
+    # kept here as the baseline for bench_callbacks()
+    def __init__(self):
+        self.events = []
+        self.recording = True
+
+    def on_move(self, x, y):
+        if self.recording:
+            event = {'type': 'mouse', 'action': 'move', 'x': x, 'y': y, 'time': time.time()}
+            self.events.append(event)
+
+    def on_click(self, x, y, button, pressed):
+        if self.recording:
+            event = {'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': button.name, 'pressed': pressed, 'time': time.time()}
+            self.events.append(event)
+
+    def on_press(self, key):
+        if self.recording:
+            try:
+                event = {'type': 'keyboard', 'action': 'press', 'key': key.char if hasattr(key, 'char') else key.name, 'time': time.time()}
+                self.events.append(event)
+            except AttributeError:
+                event = {'type': 'keyboard', 'action': 'press', 'key': str(key), 'time': time.time()}
+                self.events.append(event)
+
+
+def time_callbacks(target, n):
+    on_move, on_click, on_press = target.on_move, target.on_click, target.on_press
+    button = mouse.Button.left
+    key = keyboard.KeyCode.from_char('a')
+    special = keyboard.Key.shift
+    start = time.perf_counter_ns()
+    for i in range(n):
+        on_move(i & 1023, i & 511)
+        if i & 63 == 0:
+            on_click(i & 1023, i & 511, button, True)
+            on_press(key)
+            on_press(special)
+    elapsed = time.perf_counter_ns() - start
+    calls = n + 3 * ((n + 63) // 64)
+    return {'calls': calls, 'events_per_sec': calls / (elapsed / 1e9), 'ns_per_callback': elapsed / calls}
+
+
+def bench_callbacks(n=200000, rounds=5):
+    # Median of several rounds, each on a fresh recorder. Only the callback
+    # cost is measured: the ring is large enough that the writer thread never
+    # has to run during the timed loop.
+    def median(make):
+        runs = sorted((time_callbacks(make(), n) for _ in range(rounds)), key=lambda run: run['ns_per_callback'])
+        return runs[len(runs) // 2]
+
+    def recorder():
+        recorder = Recorder(capacity=n * 2)
+        recorder.recording = True
+        return recorder
+
+    legacy = median(LegacyRecorder)
+    ring = median(recorder)
+    return {'bench': 'callbacks', 'rounds': rounds, 'legacy': legacy, 'ring': ring,
+            'speedup': legacy['ns_per_callback'] / ring['ns_per_callback']}
+
+
+def bench_files(n, directory, memory=True):
+    results = []
+    player = Player()
+    for format in ('json', 'binary'):
+        filename = os.path.join(directory, f'bench-{n}.{format}.rec')
+        _, seconds, peak = measure(lambda: recfile.save(filename, synthetic(n), format), memory)
+        results.append({'bench': 'save', 'format': format, 'events': n, 'seconds': seconds,
+                        'events_per_sec': n / seconds, 'peak_bytes': peak,
+                        'file_bytes': os.path.getsize(filename)})
+
+        def load():
+            player.load(filename)
+            loaded = len(player.events)
+            player.close()
+            return loaded
+
+        _, seconds, peak = measure(load, memory)
+        results.append({'bench': 'load', 'format': format, 'events': n, 'seconds': seconds,
+                        'events_per_sec': n / seconds, 'peak_bytes': peak})
+
+        def stream():
+            return sum(len(chunk) for chunk in recfile.stream(filename))
+
+        _, seconds, peak = measure(stream, memory)
+        results.append({'bench': 'stream', 'format': format, 'events': n, 'seconds': seconds,
+                        'events_per_sec': n / seconds, 'peak_bytes': peak})
+        os.remove(filename)
+    return results
+
+
+def time_playback(events):
+    # Compile, then play in real time against the stand-in controllers
+    player = Player()
+    start = time.perf_counter()
+    plan = player.compile(events)
+    compiled = time.perf_counter()
+    player.play(plan)
+    return {'compile_seconds': compiled - start, 'seconds': time.perf_counter() - compiled,
+            'lateness_ms': player.lateness.summary()}
+
+
+def bench_playback(n, rate):
+    return {'bench': 'playback', 'events': n, 'rate': rate, **time_playback(list(synthetic(n, rate)))}
+
+
+def bench_file(filename):
+    # Load time, compile time and lateness for one recording
+    start = time.perf_counter()
+    events = recfile.load(filename)
+    loaded = time.perf_counter()
+    try:
+        return {'bench': 'file', 'file': filename, 'events': len(events), 'load_seconds': loaded - start,
+                **time_playback(events)}
+    finally:
+        if isinstance(events, recfile.Recording):
+            events.close()
+
+
+def bench_startup(directory, runs=5):
+    # End to end: from spawning `cli.py --fake play` to its first event
+    import cli
+
+    filename = os.path.join(directory, 'startup.rec')
+    recfile.save(filename, synthetic(10))
+    script = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'cli.py')
+    samples = []
+    for _ in range(runs):
+        spawned = time.time_ns()
+        output = subprocess.run([sys.executable, script, '--fake', 'play', filename, '--timing'],
+                                capture_output=True, text=True).stdout
+        timing = json.loads(output.strip().splitlines()[-1])
+        samples.append((timing['first_event_unix_ns'] - spawned) / 1e6)
+    samples.sort()
+    return {'bench': 'startup', 'runs': runs, 'median_ms': samples[len(samples) // 2], 'max_ms': samples[-1],
+            'budget_ms': cli.STARTUP_BUDGET_MS, 'within_budget': samples[len(samples) // 2] <= cli.STARTUP_BUDGET_MS}
+
+
+def bench_hotkeys(triggers=50):
+    # Trigger-to-first-event latency for a pre-compiled macro bound to a chord
+    from hotkeys import HotkeyManager
+
+    with tempfile.TemporaryDirectory() as directory:
+        filename = os.path.join(directory, 'hotkey.rec')
+        recfile.save(filename, synthetic(1000, rate=100000.0))
+        manager = HotkeyManager(Player())
+        manager.bind('ctrl+1', filename)
+    manager.start()
+    for _ in range(triggers):
+        manager.on_press(keyboard.Key.ctrl_l)
+        manager.on_press(keyboard.KeyCode.from_char('1'))
+        manager.on_release(keyboard.KeyCode.from_char('1'))
+        manager.on_release(keyboard.Key.ctrl_l)
+        while manager.current is not None or not manager.pending.empty():
+            time.sleep(0.001)
+    manager.stop()
+    return {'bench': 'hotkeys', 'triggers': triggers, **manager.stats()}
+
+
+def bench_batch(directory, files, events):
+    # Batch validate-and-convert of JSON files at 1, 2, 4... workers up to the
+    # core count; speedup is relative to one worker
+    import batch
+
+    sources = os.path.join(directory, 'batch')
+    os.makedirs(sources, exist_ok=True)
+    for i in range(files):
+        recfile.save(os.path.join(sources, f'{i}.rec'), synthetic(events, seed=i), 'json')
+    names = batch.find_recordings([sources])
+    counts = []
+    workers = 1
+    while workers < (os.cpu_count() or 1):
+        counts.append(workers)
+        workers *= 2
+    counts.append(os.cpu_count() or 1)
+    runs = []
+    for workers in counts:
+        report = batch.run(names, os.path.join(directory, f'batch-{workers}'), workers=workers, fake=True)
+        runs.append({'workers': workers, 'seconds': report['seconds'], 'speedup': runs[0]['seconds'] / report['seconds'] if runs else 1.0})
+    return {'bench': 'batch', 'files': files, 'events_per_file': events, 'runs': runs}
+
+
+def run_suite(args):
+    results = [bench_callbacks(args.callbacks)]
+    with tempfile.TemporaryDirectory() as directory:
+        for size in args.sizes.split(','):
+            if size.strip():
+                results.extend(bench_files(int(size), directory, not args.no_memory))
+        if args.startup_runs:
+            results.append(bench_startup(directory, args.startup_runs))
+        if args.batch_files:
+            results.append(bench_batch(directory, args.batch_files, args.batch_events))
+    if args.hotkey_triggers:
+        results.append(bench_hotkeys(args.hotkey_triggers))
+    if args.playback_events:
+        results.append(bench_playback(args.playback_events, args.playback_rate))
+    return results
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark LWmacro hot paths with stand-in controllers.")
+    parser.add_argument('file', nargs='?', help="time loading, compiling and playing this recording instead")
+    parser.add_argument('--sizes', default='10000,100000,1000000',
+                        help="comma-separated recording sizes for the save/load benchmarks (up to 10M)")
+    parser.add_argument('--callbacks', type=int, default=200000, help="callback invocations to time")
+    parser.add_argument('--playback-events', type=int, default=10000, help="events to play back")
+    parser.add_argument('--playback-rate', type=float, default=1000.0, help="events per second during playback")
+    parser.add_argument('--startup-runs', type=int, default=5, help="cold starts of the CLI to time, 0 to skip")
+    parser.add_argument('--batch-files', type=int, default=16, help="JSON files for the batch benchmark, 0 to skip")
+    parser.add_argument('--batch-events', type=int, default=50000, help="events per batch benchmark file")
+    parser.add_argument('--hotkey-triggers', type=int, default=50, help="hotkey triggers to time, 0 to skip")
+    parser.add_argument('--no-memory', action='store_true', help="skip the tracemalloc peak-memory runs")
+    parser.add_argument('--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+
+    results = [bench_file(args.file)] if args.file else run_suite(args)
+    report = {
+        'time': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'results': results,
+    }
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+
+
+if __name__ == "__main__":
+    main()
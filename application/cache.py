@@ -0,0 +1,93 @@
+# cache.py
+
+import os
+from collections import OrderedDict
+
+import recfile
+
+# Rough in-memory cost used for the budget. Binary recordings are charged
+# for their mapped columns instead.
+EVENT_BYTES = 400
+STEP_BYTES = 160
+
+
+class Entry:
+    def __init__(self, stamp, events):
+        self.stamp = stamp
+        self.events = events
+        self.plans = {}
+
+    def size(self):
+        if isinstance(self.events, recfile.Recording):
+            events = sum(len(column) * column.itemsize for column in self.events.columns.values())
+        else:
+            events = len(self.events) * EVENT_BYTES
+        return events + sum(len(plan) for plan in self.plans.values()) * STEP_BYTES
+
+    def close(self):
+        if isinstance(self.events, recfile.Recording):
+            self.events.close()
+
+
+class RecordingCache:
+    # Parsed recordings and their compiled plans, keyed by absolute path and
+    # invalidated when the file's mtime or size changes. Least recently used
+    # entries are evicted once the estimated size exceeds `budget` bytes.
+    def __init__(self, budget=256 * 1024 * 1024):
+        self.budget = budget
+        self.entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def entry(self, filename):
+        path = os.path.abspath(filename)
+        st = os.stat(path)
+        stamp = (st.st_mtime_ns, st.st_size)
+        entry = self.entries.get(path)
+        if entry is not None and entry.stamp == stamp:
+            self.hits += 1
+            self.entries.move_to_end(path)
+            return entry
+        self.misses += 1
+        if entry is not None:
+            del self.entries[path]
+            entry.close()
+        entry = Entry(stamp, recfile.load(path))
+        self.entries[path] = entry
+        return entry
+
+    def load(self, filename):
+        entry = self.entry(filename)
+        self.evict()
+        return entry.events
+
+    def plan(self, filename, player):
+        # Plans are bound to a player's controllers and timing options
+        entry = self.entry(filename)
+        key = (player, player.speed, player.max_gap, player.fast, player.min_click, player.min_hold,
+               player.coalesce, player.scroll_window, player.resample, player.interpolation)
+        if key not in entry.plans:
+            entry.plans[key] = player.compile(entry.events)
+        self.evict()
+        return entry.events, entry.plans[key]
+
+    def size(self):
+        return sum(entry.size() for entry in self.entries.values())
+
+    def evict(self):
+        # Never evict the most recently used entry, even if it alone is over budget
+        total = self.size()
+        while total > self.budget and len(self.entries) > 1:
+            _, entry = self.entries.popitem(last=False)
+            total -= entry.size()
+            entry.close()
+
+    def discard(self, filename):
+        entry = self.entries.pop(os.path.abspath(filename), None)
+        if entry is not None:
+            entry.close()
+
+    def clear(self):
+        for entry in self.entries.values():
+            entry.close()
+        self.entries.clear()
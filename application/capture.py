@@ -0,0 +1,90 @@
+# capture.py
+
+import itertools
+import time
+
+from recfile import ACTIONS
+
+MOVE, CLICK, SCROLL, PRESS, RELEASE = range(len(ACTIONS))
+
+
+def key_name(key):
+    try:
+        return key.char if hasattr(key, 'char') else key.name
+    except AttributeError:
+        # Special keys handling
+        return str(key)
+
+
+class RingBuffer:
+    # Preallocated ring written by the listener threads and drained by a
+    # single consumer thread. Each field has its own preallocated list, so a
+    # callback only stores ints and references and allocates nothing the
+    # garbage collector has to track:
+    #   seqs     sequence number, set to -1 before the other fields are
+    #            written and stored last to publish the record
+    #   times    perf_counter_ns() stamp
+    #   actions  MOVE, CLICK, SCROLL, PRESS or RELEASE
+    #   xs, ys   cursor position
+    #   a, b     button/key/dx and pressed/dy
+    # Producers claim a sequence number with next(), which is atomic under the
+    # GIL, so the callbacks need no lock. They store the raw pynput button/key
+    # object and leave turning it into a name to the consumer. A consumer that
+    # falls a full lap behind finds its records overwritten and counts them
+    # in `dropped`; the recorder reports that as an error.
+    def __init__(self, capacity=65536):
+        size = 1
+        while size < capacity:
+            size <<= 1
+        self.capacity = size
+        self.mask = size - 1
+        self.seqs = [-1] * size
+        self.times = [0] * size
+        self.actions = [0] * size
+        self.xs = [0] * size
+        self.ys = [0] * size
+        self.a = [None] * size
+        self.b = [None] * size
+        self.seq = itertools.count()
+        self.tail = 0
+        self.dropped = 0
+
+        # perf_counter_ns() stamps are mapped back onto the wall clock once,
+        # so a clock change mid-recording cannot reorder events
+        self.epoch_ns = time.time_ns() - time.perf_counter_ns()
+
+    def claimed(self):
+        # Sequence numbers handed out so far; itertools.count only exposes
+        # its position through repr()
+        return int(repr(self.seq)[6:-1])
+
+    def pop(self, limit):
+        seqs, times, actions, xs, ys, a, b = self.seqs, self.times, self.actions, self.xs, self.ys, self.a, self.b
+        mask = self.mask
+        epoch_ns = self.epoch_ns
+        seq = self.tail
+        events = []
+        while len(events) < limit:
+            i = seq & mask
+            published = seqs[i]
+            if published < seq:
+                break
+            record = times[i], actions[i], xs[i], ys[i], a[i], b[i]
+            if published > seq or seqs[i] != published:
+                # Overwritten before or while it was read
+                self.dropped += 1
+                seq += 1
+                continue
+            seq += 1
+            t, action, x, y, first, second = record
+            t = (t + epoch_ns) / 1e9
+            if action == MOVE:
+                events.append({'type': 'mouse', 'action': 'move', 'x': x, 'y': y, 'time': t})
+            elif action == PRESS or action == RELEASE:
+                events.append({'type': 'keyboard', 'action': ACTIONS[action], 'key': key_name(first), 'time': t})
+            elif action == CLICK:
+                events.append({'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': first.name, 'pressed': second, 'time': t})
+            else:
+                events.append({'type': 'mouse', 'action': 'scroll', 'x': x, 'y': y, 'dx': first, 'dy': second, 'time': t})
+        self.tail = seq
+        return events
@@ -0,0 +1,357 @@
+# cli.py
+
+import time
+
+STARTED_NS = time.perf_counter_ns()
+
+import argparse
+import json
+import sys
+
+# Everything heavier than argparse is imported inside the command that needs
+# it: convert and inspect never load pynput, and nothing here loads tkinter.
+
+# Budget from this module loading to the first played event, checked by
+# play --timing; bench.py also times it end to end from process spawn
+STARTUP_BUDGET_MS = 200
+
+
+def use_fake_input(args):
+    if args.fake:
+        import fakeinput
+        fakeinput.install()
+
+
+def cmd_record(args):
+    use_fake_input(args)
+    from recorder import Recorder
+
+    if args.loops and args.format != 'json':
+        raise SystemExit("--loops needs --format json; the binary format has no loop blocks")
+    recorder = Recorder()
+    recorder.start(args.file + ".part")
+    print(f"Recording to {args.file}, press Ctrl+C to stop", file=sys.stderr)
+    try:
+        if args.duration:
+            time.sleep(args.duration)
+        else:
+            while True:
+                time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    try:
+        recorder.stop()
+    except RuntimeError as e:
+        raise SystemExit(str(e))
+    recorder.save(args.file, args.format, args.simplify, args.coalesce, args.loops)
+
+
+def load_tracks(args):
+    # The main file first, then each --layer FILE [OFFSET [SPEED]]
+    import recfile
+    from player import Track
+
+    tracks = [Track(recfile.load(args.file), name=args.file)]
+    for layer in args.layer:
+        if len(layer) > 3:
+            raise SystemExit(f"--layer takes FILE [OFFSET [SPEED]], got {' '.join(layer)}")
+        filename, offset, speed = layer[0], float((layer[1:] or [0])[0]), float((layer[2:] or [1])[0])
+        tracks.append(Track(recfile.load(filename), offset, speed, name=filename))
+    return tracks
+
+
+def cmd_play(args):
+    use_fake_input(args)
+    from player import Player
+
+    player = Player()
+    player.speed = args.speed
+    player.max_gap = args.max_gap
+    player.fast = args.fast
+    player.min_click = player.min_hold = args.min_hold / 1000
+    player.coalesce = args.coalesce
+    player.resample = args.resample
+    player.interpolation = args.interpolation
+    try:
+        if args.layer:
+            if args.stream or args.library or args.start or args.end is not None:
+                raise SystemExit("--layer cannot be combined with --stream, --library, --start or --end")
+            player.play(player.compile_tracks(load_tracks(args)), args.repeat)
+        elif args.library:
+            from library import Library
+            library = Library(args.library)
+            player.events = library.load(args.file)
+            library.close()
+            if args.start or args.end is not None:
+                player.play(player.compile_range(player.events, args.start, args.end), args.repeat)
+            else:
+                player.play(player.compile(player.events), args.repeat)
+        elif args.stream:
+            if args.start or args.end is not None:
+                raise SystemExit("--stream cannot be combined with --start or --end")
+            player.play_stream(args.file, repeat=args.repeat)
+        elif args.start or args.end is not None:
+            import recfile
+            player.events = recfile.load(args.file)
+            player.play(player.compile_range(player.events, args.start, args.end), args.repeat)
+        else:
+            player.load(args.file)
+            player.play(player.plan, args.repeat)
+    except KeyboardInterrupt:
+        player.stop()
+
+    if args.timing:
+        # The first step is scheduled at offset 0, so it fires when the
+        # scheduler starts
+        first_ns = player.scheduler.start_ns
+        startup_ms = (first_ns - STARTED_NS) / 1e6
+        first_unix_ns = time.time_ns() - (time.perf_counter_ns() - first_ns)
+        print(json.dumps({'startup_ms': startup_ms, 'first_event_unix_ns': first_unix_ns,
+                          'lateness_ms': player.lateness.summary() if player.lateness else None}))
+        if startup_ms > STARTUP_BUDGET_MS:
+            print(f"Startup took {startup_ms:.1f} ms, over the {STARTUP_BUDGET_MS} ms budget", file=sys.stderr)
+            return 1
+    return 0
+
+
+def cmd_hotkeys(args):
+    use_fake_input(args)
+    from player import Player
+    from hotkeys import HotkeyManager, POLICIES
+
+    player = Player()
+    player.speed = args.speed
+    player.max_gap = args.max_gap
+    player.fast = args.fast
+    player.min_click = player.min_hold = args.min_hold / 1000
+    manager = HotkeyManager(player)
+    for bind in args.bind:
+        if not 2 <= len(bind) <= 4 or (len(bind) > 2 and bind[2] not in POLICIES):
+            raise SystemExit(f"--bind takes CHORD FILE [{'|'.join(POLICIES)} [REPEAT]], got {' '.join(bind)}")
+        policy = bind[2] if len(bind) > 2 else args.policy
+        repeat = int(bind[3]) if len(bind) > 3 else 1
+        binding = manager.bind(bind[0], bind[1], policy, repeat)
+        print(f"{binding.chord}: {binding.name} ({len(binding.plan)} steps, {binding.policy})", file=sys.stderr)
+    manager.start()
+    print("Listening for hotkeys, press Ctrl+C to stop", file=sys.stderr)
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+    manager.stop()
+    print(json.dumps(manager.stats()))
+
+
+def cmd_convert(args):
+    import recfile
+
+    if args.simplify is None and not args.coalesce and not args.resample and not args.loops:
+        recfile.convert(args.source, args.destination, args.format)
+        return
+    import passes
+
+    format = args.format or ('json' if recfile.is_binary(args.source) else 'binary')
+    original = recfile.load(args.source)
+    if recfile.has_loops(original):
+        original = list(recfile.expand_loops(original))
+    events = original
+    if args.coalesce:
+        events = list(passes.coalesce(events))
+    ratio = 0.0
+    if args.simplify is not None:
+        events, ratio = passes.simplify_moves(events, args.simplify)
+    if args.resample:
+        events = list(passes.resample_moves(events, args.resample, args.interpolation))
+    if args.loops:
+        if format != 'json':
+            raise SystemExit("--loops needs --format json; the binary format has no loop blocks")
+        events, _ = passes.compact_loops(events)
+    recfile.save(args.destination, events, format)
+    print(f"Kept {len(events)} of {len(original)} events ({ratio:.1%} removed by simplifying)", file=sys.stderr)
+
+
+def cmd_inspect(args):
+    import recfile
+
+    if recfile.is_binary(args.file):
+        format = 'binary'
+    elif recfile.is_journal(args.file):
+        format = 'journal'
+    else:
+        format = 'json'
+    summary = recfile.summarize(event for chunk in recfile.iter_chunks(args.file) for event in chunk)
+    summary['format'] = format
+    print(json.dumps(summary, indent=2))
+
+
+def cmd_library(args):
+    from library import Library
+
+    library = Library(args.library)
+    try:
+        if args.action == 'add':
+            for filename in args.files:
+                library.import_file(filename, replace=args.replace)
+        elif args.action == 'list':
+            macros = library.search(args.search, args.key, args.min_duration, args.max_duration, args.order)
+            if args.json:
+                print(json.dumps(macros, indent=2))
+            for macro in () if args.json else macros:
+                print(f"{macro['name']}\t{macro['duration']:.2f}s\t{macro['events']} events\t"
+                      f"{time.strftime('%Y-%m-%d %H:%M', time.localtime(macro['created']))}")
+        elif args.action == 'info':
+            print(json.dumps(library.info(args.name), indent=2))
+        elif args.action == 'export':
+            library.export(args.name, args.file, args.format)
+        elif args.action == 'rename':
+            library.rename(args.name, args.new_name)
+        elif args.action == 'remove':
+            library.remove(args.name)
+    except KeyError as e:
+        raise SystemExit(f"No macro named {e} in {args.library}")
+    except ValueError as e:
+        raise SystemExit(str(e))
+    finally:
+        library.close()
+
+
+def cmd_batch(args):
+    import batch
+
+    files = batch.find_recordings(args.paths)
+    report = batch.run(files, args.output, args.format, args.coalesce, args.simplify, args.workers, args.fake)
+    if args.report:
+        with open(args.report, 'w') as f:
+            json.dump(report, f, indent=2)
+    else:
+        print(json.dumps(report, indent=2))
+    print(f"Checked {report['files']} files ({report['events']} events) in {report['seconds']:.2f} s "
+          f"on {report['workers']} workers: {len(report['failed'])} failed, "
+          f"{len(report['with_invalid_keys'])} with invalid keys", file=sys.stderr)
+    if report['names_checked_with'] != 'pynput' and not args.fake:
+        print("  pynput is unavailable here, so key and button names were checked against the stand-ins",
+              file=sys.stderr)
+    for entry in report['invalid_keys']:
+        print(f"  {entry['key']!r}: {entry['events']} events, {entry['reason']}", file=sys.stderr)
+    return 1 if report['failed'] or report['invalid_keys'] else 0
+
+
+def cmd_bench(args):
+    import bench
+    bench.main(args.bench_args)
+
+
+def build_parser():
+    parser = argparse.ArgumentParser(prog="lwmacro", description="Record, play and manage LWmacro .rec files without the GUI.")
+    parser.add_argument('--fake', action='store_true', help="use stand-in controllers instead of pynput (dry run)")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    record = commands.add_parser('record', help="record mouse and keyboard input")
+    record.add_argument('file')
+    record.add_argument('--duration', type=float, help="stop after this many seconds")
+    record.add_argument('--format', choices=('binary', 'json'), default='binary')
+    record.add_argument('--simplify', type=float, help="drop redundant mouse moves within this many pixels")
+    record.add_argument('--coalesce', action='store_true', help="collapse autorepeat, scroll bursts and repeated moves")
+    record.add_argument('--loops', action='store_true', help="store repeated sequences as loop blocks (JSON only)")
+    record.set_defaults(func=cmd_record)
+
+    play = commands.add_parser('play', help="play a recording")
+    play.add_argument('file')
+    play.add_argument('--speed', type=float, default=1.0)
+    play.add_argument('--max-gap', type=float, help="cap any single gap at this many seconds")
+    play.add_argument('--fast', action='store_true', help="play as fast as the controllers allow")
+    play.add_argument('--min-hold', type=float, default=0.0, help="minimum click/key hold in milliseconds")
+    play.add_argument('--repeat', type=int, default=1, help="number of runs, 0 to loop until interrupted")
+    play.add_argument('--start', type=float, default=0.0, help="start this many seconds into the recording")
+    play.add_argument('--end', type=float, help="stop this many seconds into the recording")
+    play.add_argument('--stream', action='store_true', help="stream the file instead of loading it first")
+    play.add_argument('--timing', action='store_true', help="report startup time and lateness as JSON")
+    play.add_argument('--coalesce', action='store_true', help="collapse autorepeat, scroll bursts and repeated moves")
+    play.add_argument('--resample', type=float, metavar='HZ', help="replay mouse paths at this fixed rate, e.g. 60, 120 or 240")
+    play.add_argument('--interpolation', choices=('linear', 'spline'), default='linear', help="how --resample fills in the path")
+    play.add_argument('--layer', nargs='+', action='append', default=[], metavar='FILE [OFFSET [SPEED]]',
+                      help="play another recording on top, starting OFFSET seconds in at SPEED (repeatable)")
+    play.add_argument('--library', help="play the macro named FILE from this library")
+    play.set_defaults(func=cmd_play)
+
+    hotkeys = commands.add_parser('hotkeys', help="play macros from global key chords")
+    hotkeys.add_argument('--bind', nargs='+', action='append', required=True, metavar='CHORD FILE [POLICY [REPEAT]]',
+                         help="bind a chord such as ctrl+alt+1 to a recording (repeatable)")
+    hotkeys.add_argument('--policy', choices=('queue', 'restart', 'ignore'), default='queue',
+                         help="what a trigger does while a macro is playing")
+    hotkeys.add_argument('--speed', type=float, default=1.0)
+    hotkeys.add_argument('--max-gap', type=float, help="cap any single gap at this many seconds")
+    hotkeys.add_argument('--fast', action='store_true', help="play as fast as the controllers allow")
+    hotkeys.add_argument('--min-hold', type=float, default=0.0, help="minimum click/key hold in milliseconds")
+    hotkeys.set_defaults(func=cmd_hotkeys)
+
+    convert = commands.add_parser('convert', help="convert between the JSON and binary formats")
+    convert.add_argument('source')
+    convert.add_argument('destination')
+    convert.add_argument('--format', choices=('binary', 'json'))
+    convert.add_argument('--simplify', type=float, help="drop redundant mouse moves within this many pixels")
+    convert.add_argument('--coalesce', action='store_true', help="collapse autorepeat, scroll bursts and repeated moves")
+    convert.add_argument('--resample', type=float, metavar='HZ', help="rewrite mouse paths at this fixed rate")
+    convert.add_argument('--interpolation', choices=('linear', 'spline'), default='linear')
+    convert.add_argument('--loops', action='store_true', help="store repeated sequences as loop blocks (JSON only)")
+    convert.set_defaults(func=cmd_convert)
+
+    inspect = commands.add_parser('inspect', help="summarize a recording")
+    inspect.add_argument('file')
+    inspect.set_defaults(func=cmd_inspect)
+
+    library = commands.add_parser('library', help="manage a single-file macro library")
+    library.add_argument('library')
+    actions = library.add_subparsers(dest='action', required=True)
+    add = actions.add_parser('add', help="import .rec files, named after the file")
+    add.add_argument('files', nargs='+')
+    add.add_argument('--replace', action='store_true', help="overwrite macros with the same name")
+    listing = actions.add_parser('list', help="list or search macros without decoding them")
+    listing.add_argument('--search', help="part of the macro name")
+    listing.add_argument('--key', help="only macros that use this key")
+    listing.add_argument('--min-duration', type=float)
+    listing.add_argument('--max-duration', type=float)
+    listing.add_argument('--order', choices=('name', 'created', 'duration', 'events'), default='name')
+    listing.add_argument('--json', action='store_true')
+    info = actions.add_parser('info', help="show a macro's summary")
+    info.add_argument('name')
+    export = actions.add_parser('export', help="write a macro out as a .rec file")
+    export.add_argument('name')
+    export.add_argument('file')
+    export.add_argument('--format', choices=('binary', 'json'), default='binary')
+    rename = actions.add_parser('rename')
+    rename.add_argument('name')
+    rename.add_argument('new_name')
+    remove = actions.add_parser('remove')
+    remove.add_argument('name')
+    library.set_defaults(func=cmd_library)
+
+    batch = commands.add_parser('batch', help="validate, and optionally convert, many recordings in parallel")
+    batch.add_argument('paths', nargs='+', help=".rec files or directories to search")
+    batch.add_argument('--output', help="write converted copies here, mirroring the source tree")
+    batch.add_argument('--format', choices=('binary', 'json'), default='binary')
+    batch.add_argument('--simplify', type=float, help="drop redundant mouse moves within this many pixels")
+    batch.add_argument('--coalesce', action='store_true', help="collapse autorepeat, scroll bursts and repeated moves")
+    batch.add_argument('--workers', type=int, help="worker processes (default: one per core)")
+    batch.add_argument('--report', help="write the JSON report here instead of stdout")
+    batch.set_defaults(func=cmd_batch)
+
+    bench = commands.add_parser('bench', help="run the benchmark suite, or time one recording with 'bench FILE' "
+                                                 "(arguments are passed through)")
+    bench.set_defaults(func=cmd_bench)
+    return parser
+
+
+def main(argv=None):
+    parser = build_parser()
+    args, extra = parser.parse_known_args(argv)
+    if args.command == 'bench':
+        args.bench_args = extra
+    elif extra:
+        parser.error(f"unrecognized arguments: {' '.join(extra)}")
+    return args.func(args) or 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
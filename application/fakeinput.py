@@ -0,0 +1,121 @@
+# fakeinput.py
+
+import enum
+import sys
+import types
+
+# Stand-ins for the parts of pynput this project uses, so the recorder and
+# player can run on a machine without a display. install() has to run before
+# recorder.py or player.py is imported.
+
+SPECIAL_KEYS = (
+    'alt', 'alt_l', 'alt_r', 'alt_gr', 'backspace', 'caps_lock', 'cmd', 'cmd_l', 'cmd_r',
+    'ctrl', 'ctrl_l', 'ctrl_r', 'delete', 'down', 'end', 'enter', 'esc',
+    'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8', 'f9', 'f10', 'f11', 'f12',
+    'home', 'insert', 'left', 'media_next', 'media_play_pause', 'media_previous',
+    'media_volume_down', 'media_volume_mute', 'media_volume_up', 'menu', 'num_lock',
+    'page_down', 'page_up', 'pause', 'print_screen', 'right', 'scroll_lock',
+    'shift', 'shift_l', 'shift_r', 'space', 'tab', 'up',
+)
+
+Button = enum.Enum('Button', ('unknown', 'left', 'middle', 'right', 'x1', 'x2'))
+
+
+class KeyCode:
+    def __init__(self, vk=None, char=None):
+        self.vk = vk
+        self.char = char
+
+    @classmethod
+    def from_char(cls, char):
+        return cls(char=char)
+
+    @classmethod
+    def from_vk(cls, vk):
+        return cls(vk=vk)
+
+    def __eq__(self, other):
+        return isinstance(other, KeyCode) and (self.vk, self.char) == (other.vk, other.char)
+
+    def __hash__(self):
+        return hash((self.vk, self.char))
+
+    def __str__(self):
+        return repr(self.char) if self.char is not None else f'<{self.vk}>'
+
+
+Key = enum.Enum('Key', {name: KeyCode(vk=i + 1) for i, name in enumerate(SPECIAL_KEYS)})
+
+
+class MouseController:
+    # Controllers keep every call as (name, argument) in `calls`
+    def __init__(self):
+        self._position = (0, 0)
+        self.calls = []
+
+    @property
+    def position(self):
+        return self._position
+
+    @position.setter
+    def position(self, position):
+        self._position = tuple(position)
+        self.calls.append(('position', self._position))
+
+    def press(self, button):
+        self.calls.append(('press', button))
+
+    def release(self, button):
+        self.calls.append(('release', button))
+
+    def scroll(self, dx, dy):
+        self.calls.append(('scroll', (dx, dy)))
+
+    def move(self, dx, dy):
+        x, y = self.position
+        self.position = (x + dx, y + dy)
+
+
+class KeyboardController:
+    def __init__(self):
+        self.calls = []
+
+    def press(self, key):
+        self.calls.append(('key_press', key))
+
+    def release(self, key):
+        self.calls.append(('key_release', key))
+
+
+class Listener:
+    # Never produces events by itself; drive the callbacks directly instead
+    def __init__(self, **callbacks):
+        self.callbacks = callbacks
+        self.running = False
+
+    def start(self):
+        self.running = True
+
+    def stop(self):
+        self.running = False
+
+    def join(self, timeout=None):
+        pass
+
+
+def install():
+    mouse = types.ModuleType('pynput.mouse')
+    mouse.Button = Button
+    mouse.Controller = MouseController
+    mouse.Listener = Listener
+
+    keyboard = types.ModuleType('pynput.keyboard')
+    keyboard.Key = Key
+    keyboard.KeyCode = KeyCode
+    keyboard.Controller = KeyboardController
+    keyboard.Listener = Listener
+
+    pynput = types.ModuleType('pynput')
+    pynput.mouse = mouse
+    pynput.keyboard = keyboard
+    sys.modules.update({'pynput': pynput, 'pynput.mouse': mouse, 'pynput.keyboard': keyboard})
@@ -1,20 +1,30 @@
 import tkinter as tk
 from tkinter import ttk, filedialog, messagebox
-import threading
 import os
+import queue
 
 from recorder import Recorder
 from player import Player
+from cache import RecordingCache
+from instrument import Instruments
+from worker import MacroController
 
 class LWmacroApp:
     def __init__(self, root):
         self.root = root
         self.recorder = Recorder()
-        self.player = Player()
+        self.player = Player(cache=RecordingCache())
+        self.controller = MacroController(self.recorder, self.player)
         self.filename = "recording.rec"
         self.always_on_top = True
         self.draggable = True
+        self.repeat = 1
+        self.instruments = None
+        self.stats_window = None
+        # Recordings larger than this are played while streaming from disk
+        self.stream_threshold = 64 * 1024 * 1024
         self.setup_gui()
+        self.poll_status()
 
     def setup_gui(self):
         self.root.title("LWmacro")
@@ -25,7 +35,7 @@ class LWmacroApp:
 
         screen_width = self.root.winfo_screenwidth()
         screen_height = self.root.winfo_screenheight()
-        self.root.geometry(f"700x600+{screen_width - 700 - 20}+{screen_height - 500 - 200}")
+        self.root.geometry(f"700x640+{screen_width - 700 - 20}+{screen_height - 500 - 200}")
 
         style = ttk.Style()
         style.theme_use('clam')
@@ -50,6 +60,28 @@ class LWmacroApp:
         self.play_button = ttk.Button(self.root, text="Play", command=self.play, state=tk.DISABLED)
         self.play_button.pack(pady=10)
 
+        self.options_frame = tk.Frame(self.root, bg="#2c3e50")
+        self.options_frame.pack(pady=5)
+
+        tk.Label(self.options_frame, text="Speed", font=("Helvetica", 10), bg="#2c3e50", fg="#ecf0f1").pack(side=tk.LEFT)
+        self.speed_var = tk.StringVar(value="1")
+        ttk.Combobox(self.options_frame, textvariable=self.speed_var, values=("0.25", "0.5", "1", "2", "5", "10", "20"), width=5).pack(side=tk.LEFT, padx=5)
+
+        tk.Label(self.options_frame, text="Max gap (s)", font=("Helvetica", 10), bg="#2c3e50", fg="#ecf0f1").pack(side=tk.LEFT)
+        self.max_gap_var = tk.StringVar(value="")
+        ttk.Entry(self.options_frame, textvariable=self.max_gap_var, width=5).pack(side=tk.LEFT, padx=5)
+
+        tk.Label(self.options_frame, text="Min hold (ms)", font=("Helvetica", 10), bg="#2c3e50", fg="#ecf0f1").pack(side=tk.LEFT)
+        self.min_hold_var = tk.StringVar(value="0")
+        ttk.Entry(self.options_frame, textvariable=self.min_hold_var, width=5).pack(side=tk.LEFT, padx=5)
+
+        self.fast_var = tk.BooleanVar(value=False)
+        ttk.Checkbutton(self.options_frame, text="As fast as possible", variable=self.fast_var).pack(side=tk.LEFT, padx=5)
+
+        tk.Label(self.options_frame, text="Repeat (0 = loop)", font=("Helvetica", 10), bg="#2c3e50", fg="#ecf0f1").pack(side=tk.LEFT)
+        self.repeat_var = tk.StringVar(value="1")
+        ttk.Entry(self.options_frame, textvariable=self.repeat_var, width=4).pack(side=tk.LEFT, padx=5)
+
         self.select_file_button = ttk.Button(self.root, text="Open File", command=self.select_file)
         self.select_file_button.pack(pady=10)
 
@@ -74,6 +106,9 @@ class LWmacroApp:
         self.changelog_button = ttk.Button(self.root, text="📜 Changelogs", command=self.show_changelogs)
         self.changelog_button.place(relx=1.0, rely=1.0, anchor='se', x=-10, y=-10)
 
+        self.stats_button = ttk.Button(self.root, text="📊 Stats", command=self.show_stats)
+        self.stats_button.place(relx=1.0, rely=1.0, anchor='se', x=-10, y=-60)
+
         self.credits_button = ttk.Button(self.root, text="Credits", command=self.show_credits)
         self.credits_button.place(relx=0.0, rely=1.0, anchor='sw', x=10, y=-10)
 
@@ -83,43 +118,66 @@ class LWmacroApp:
         messagebox.showinfo("Info", f"New file created: {self.filename}")
 
     def start_recording(self):
-        self.record_button.state(['disabled'])
-        self.stop_button.state(['!disabled'])
-        self.play_button.state(['disabled'])
-        threading.Thread(target=self.recorder.start).start()
+        try:
+            self.controller.record(self.filename + ".part")
+            self.record_button.state(['disabled'])
+            self.stop_button.state(['!disabled'])
+            self.play_button.state(['disabled'])
+        except Exception as e:
+            self.show_warning(f"Failed to start recording: {str(e)}")
 
     def stop(self):
-        if self.recorder.recording:
-            try:
-                self.recorder.stop()
-                self.recorder.save(self.filename)
-                self.record_button.state(['!disabled'])
-                self.stop_button.state(['disabled'])
-                self.play_button.state(['!disabled'])
-                messagebox.showinfo("Info", "Recording stopped and saved.")
-            except Exception as e:
-                self.show_warning(f"Error stopping the recording: {str(e)}")
-        elif self.player.playing:
-            try:
-                self.player.stop()
-                self.stop_button.state(['disabled'])
-                self.play_button.state(['!disabled'])
-            except Exception as e:
-                self.show_warning(f"Error stopping the playback: {str(e)}")
+        self.stop_button.state(['disabled'])
+        self.controller.stop(self.filename)
+
+    def poll_status(self):
+        # Workers report through the controller's queue; widgets are only
+        # ever touched here, on the Tk thread
+        try:
+            while True:
+                status, detail = self.controller.status.get_nowait()
+                self.handle_status(status, detail)
+        except queue.Empty:
+            pass
+        self.root.after(50, self.poll_status)
+
+    def handle_status(self, status, detail):
+        if status == 'saved':
+            self.record_button.state(['!disabled'])
+            self.stop_button.state(['disabled'])
+            self.play_button.state(['!disabled'])
+            messagebox.showinfo("Info", "Recording stopped and saved.")
+        elif status == 'finished':
+            self.stop_button.state(['disabled'])
+            self.play_button.state(['!disabled'])
+        elif status == 'error':
+            self.record_button.state(['!disabled'])
+            self.stop_button.state(['disabled'])
+            self.play_button.state(['!disabled'])
+            self.show_warning(detail)
+
+    def apply_playback_options(self):
+        self.player.speed = float(self.speed_var.get())
+        max_gap = self.max_gap_var.get().strip()
+        self.player.max_gap = float(max_gap) if max_gap else None
+        self.player.fast = self.fast_var.get()
+        min_hold = self.min_hold_var.get().strip()
+        self.player.min_click = self.player.min_hold = float(min_hold) / 1000 if min_hold else 0.0
+        self.repeat = int(self.repeat_var.get() or 1)
 
     def play(self):
         try:
-            self.player.load(self.filename)
-            threading.Thread(target=self.play_macro).start()
+            self.apply_playback_options()
+            if os.path.getsize(self.filename) > self.stream_threshold:
+                self.controller.play_stream(self.filename, self.repeat)
+            else:
+                self.player.load(self.filename)
+                self.controller.play(self.player.plan, self.repeat)
+            self.stop_button.state(['!disabled'])
+            self.play_button.state(['disabled'])
         except Exception as e:
             self.show_warning(f"Failed to play recording from {self.filename}: {str(e)}")
 
-    def play_macro(self):
-        self.stop_button.state(['!disabled'])
-        self.play_button.state(['disabled'])
-        self.player.play(self.player.events)
-        self.play_button.state(['!disabled'])
-
     def select_file(self):
         try:
             file_path = filedialog.askopenfilename(defaultextension=".rec",
@@ -136,6 +194,8 @@ class LWmacroApp:
             new_name = filedialog.asksaveasfilename(defaultextension=".rec",
                                                    filetypes=[("Recording files", "*.rec"), ("All files", "*.*")])
             if new_name:
+                self.player.close()
+                self.player.cache.discard(self.filename)
                 os.replace(self.filename, new_name)
                 self.filename = new_name
                 self.current_file_label.config(text=f"Current File: {self.filename}")
@@ -275,6 +335,66 @@ class LWmacroApp:
         done_button = ttk.Button(changelogs_window, text="Done", command=changelogs_window.destroy)
         done_button.pack(pady=10)
 
+    def show_stats(self):
+        # Instrumentation is only attached while the stats panel is open
+        if self.stats_window is not None:
+            self.stats_window.lift()
+            return
+        self.instruments = Instruments()
+        self.player.instruments = self.instruments
+        self.recorder.instruments = self.instruments
+
+        self.stats_window = tk.Toplevel(self.root)
+        self.stats_window.title("Stats")
+        self.stats_window.geometry("420x320")
+        self.stats_window.protocol("WM_DELETE_WINDOW", self.close_stats)
+
+        self.stats_text = tk.Text(self.stats_window, wrap=tk.NONE, bg="#34495e", fg="#ecf0f1", font=("Courier", 10))
+        self.stats_text.pack(fill=tk.BOTH, expand=True)
+
+        buttons = ttk.Frame(self.stats_window)
+        buttons.pack(pady=10)
+        ttk.Button(buttons, text="Export JSON", command=lambda: self.export_stats("json")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Export CSV", command=lambda: self.export_stats("csv")).pack(side=tk.LEFT, padx=5)
+        ttk.Button(buttons, text="Done", command=self.close_stats).pack(side=tk.LEFT, padx=5)
+
+        self.refresh_stats()
+
+    def refresh_stats(self):
+        if self.stats_window is None:
+            return
+        stats = self.instruments.to_dict()
+        lines = [f"{name}: {n}" for name, n in sorted(stats['counters'].items())]
+        for title, key in (("Lateness (ms)", 'lateness_ms'), ("Controller call (ms)", 'call_time_ms')):
+            summary = stats[key]
+            lines.append(f"{title}: p50 {summary['p50']:.3f}  p99 {summary['p99']:.3f}  max {summary['max']:.3f}")
+        depth = stats['queue_depth']
+        lines.append(f"Recorder queue depth: p50 {depth['p50']}  p99 {depth['p99']}  max {depth['max']}")
+
+        self.stats_text.config(state=tk.NORMAL)
+        self.stats_text.delete("1.0", tk.END)
+        self.stats_text.insert(tk.END, "\n".join(lines))
+        self.stats_text.config(state=tk.DISABLED)
+        self.root.after(500, self.refresh_stats)
+
+    def export_stats(self, kind):
+        try:
+            filename = filedialog.asksaveasfilename(defaultextension=f".{kind}",
+                                                    filetypes=[(f"{kind.upper()} files", f"*.{kind}"), ("All files", "*.*")])
+            if filename:
+                if kind == "json":
+                    self.instruments.export_json(filename)
+                else:
+                    self.instruments.export_csv(filename)
+        except Exception as e:
+            self.show_warning(f"Failed to export stats: {str(e)}")
+
+    def close_stats(self):
+        self.player.instruments = None
+        self.recorder.instruments = None
+        self.stats_window.destroy()
+        self.stats_window = None
+
     def show_credits(self):
         credits = """
         LWmacro 2.0-beta.1
@@ -0,0 +1,188 @@
+# hotkeys.py
+
+import queue
+import threading
+from collections import Counter
+from time import perf_counter_ns
+
+from pynput import keyboard
+
+import recfile
+from capture import key_name
+from scheduler import Histogram
+
+POLICIES = ('queue', 'restart', 'ignore')
+
+# Left and right modifiers count as the same key in a chord
+MODIFIERS = {
+    'ctrl_l': 'ctrl', 'ctrl_r': 'ctrl',
+    'shift_l': 'shift', 'shift_r': 'shift',
+    'alt_l': 'alt', 'alt_r': 'alt', 'alt_gr': 'alt',
+    'cmd_l': 'cmd', 'cmd_r': 'cmd',
+}
+
+
+def canonical(name):
+    if name is None:
+        return None
+    if len(name) == 1:
+        # With ctrl held some platforms report control characters: ctrl+h is '\x08'
+        if ord(name) < 32:
+            return chr(ord(name) + 96)
+        return name.lower()
+    return MODIFIERS.get(name, name)
+
+
+def parse_chord(chord):
+    # 'ctrl+alt+1' -> frozenset({'ctrl', 'alt', '1'}); names as recorded
+    keys = frozenset(canonical(part.strip()) for part in chord.split('+') if part.strip())
+    if not keys:
+        raise ValueError(f"Empty hotkey chord '{chord}'")
+    return keys
+
+
+class Binding:
+    # A chord bound to a macro, compiled when bound so a trigger goes
+    # straight to playback
+    def __init__(self, chord, plan, policy='queue', repeat=1, name=None):
+        if policy not in POLICIES:
+            raise ValueError(f"Unknown trigger policy '{policy}', expected one of {', '.join(POLICIES)}")
+        self.chord = chord
+        self.keys = parse_chord(chord)
+        self.plan = plan
+        self.policy = policy
+        self.repeat = repeat
+        self.name = name or chord
+
+
+class HotkeyManager:
+    # Global chords that start macros. The keyboard listener only matches
+    # chords and hands triggers to a single playback thread, so the listener
+    # is never blocked by playback. A trigger that arrives while a macro is
+    # playing is handled by its binding's policy:
+    #   queue    play after everything already waiting
+    #   restart  stop the running macro, drop anything waiting, play now
+    #   ignore   drop the trigger
+    # Trigger-to-first-event latency is recorded in ns for every macro that
+    # plays, including time spent waiting in the queue. Key events the
+    # player injects are ignored, so a macro cannot trigger chords.
+    def __init__(self, player):
+        self.player = player
+        self.bindings = {}
+        self.held = set()
+        self.pending = queue.Queue()
+        self.lock = threading.Lock()
+        self.current = None
+        self.listener = None
+        self.thread = None
+        self.latency = Histogram()
+        self.counters = Counter()
+
+    def bind(self, chord, filename, policy='queue', repeat=1):
+        events = recfile.load(filename)
+        try:
+            plan = self.player.compile(events)
+        finally:
+            if isinstance(events, recfile.Recording):
+                events.close()
+        binding = Binding(chord, plan, policy, repeat, filename)
+        self.bindings[binding.keys] = binding
+        return binding
+
+    def unbind(self, chord):
+        self.bindings.pop(parse_chord(chord), None)
+
+    def start(self):
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.thread.start()
+        self.listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
+        self.listener.start()
+
+    def stop(self):
+        if self.listener is not None:
+            self.listener.stop()
+            self.listener = None
+        with self.lock:
+            self.flush()
+            self.player.stop()
+            self.pending.put(None)
+        if self.thread is not None:
+            self.thread.join()
+            self.thread = None
+
+    def on_press(self, key, injected=False):
+        if injected:
+            return
+        name = canonical(key_name(key))
+        if name in self.held:
+            # Autorepeat of a key that is already down
+            return
+        self.held.add(name)
+        binding = self.bindings.get(frozenset(self.held))
+        if binding is not None:
+            self.trigger(binding)
+
+    def on_release(self, key, injected=False):
+        if injected:
+            return
+        self.held.discard(canonical(key_name(key)))
+
+    def trigger(self, binding, triggered=None):
+        if triggered is None:
+            triggered = perf_counter_ns()
+        self.counters['triggered'] += 1
+        with self.lock:
+            busy = self.current is not None or not self.pending.empty()
+            if busy and binding.policy == 'ignore':
+                self.counters['ignored'] += 1
+                return
+            if busy and binding.policy == 'restart':
+                self.counters['restarted'] += 1
+                self.flush()
+                self.player.stop()
+            elif busy:
+                self.counters['queued'] += 1
+            self.pending.put((binding, triggered))
+
+    def flush(self):
+        while True:
+            try:
+                self.pending.get_nowait()
+            except queue.Empty:
+                return
+
+    def run(self):
+        while True:
+            item = self.pending.get()
+            if item is None:
+                return
+            binding, triggered = item
+            # Marked as playing under the lock, so a restart between here and
+            # the run starting still stops it
+            with self.lock:
+                self.current = binding
+                with self.player.lock:
+                    self.player.playing = True
+            try:
+                plan = binding.plan
+                steps = iter(plan) if binding.repeat == 1 else self.player.looped(lambda: plan, binding.repeat)
+                self.player.run(self.timed(steps, triggered))
+            except Exception as e:
+                print(f"Error playing {binding.name}: {str(e)}")
+            finally:
+                with self.lock:
+                    self.current = None
+
+    def timed(self, steps, triggered):
+        # The player asks for the next step only after firing the previous
+        # one, so resuming after the first step is when it has fired. Runs
+        # stopped before any step fired are not counted.
+        for step in steps:
+            yield step
+            self.latency.add(perf_counter_ns() - triggered)
+            self.counters['played'] += 1
+            break
+        yield from steps
+
+    def stats(self):
+        return {'counters': dict(self.counters), 'latency_ms': self.latency.summary()}
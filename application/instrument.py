@@ -0,0 +1,82 @@
+# instrument.py
+
+import csv
+import json
+from collections import Counter
+
+from scheduler import Histogram
+
+HISTOGRAMS = ('lateness', 'call_time', 'queue_depth')
+
+
+class Instruments:
+    # Counters and histograms for one record or playback run. Players and
+    # recorders only touch this when an instance is attached, so leaving
+    # `instruments` as None costs nothing on the hot paths.
+    #   lateness     actual minus scheduled fire time of each step, in ns
+    #   call_time    duration of each controller call, in ns
+    #   queue_depth  events waiting in the recorder ring at each drain
+    # Hooks are called as hook(label, scheduled_ns, late_ns, call_ns) after
+    # every played step. One instance can be shared by a recorder and a
+    # player: each run only resets the counters and histograms it owns.
+    def __init__(self):
+        self.hooks = []
+        self.reset()
+
+    def reset(self):
+        self.reset_playback()
+        self.reset_recording()
+
+    def reset_playback(self):
+        self.counters = Counter()
+        self.lateness = Histogram()
+        self.call_time = Histogram()
+
+    def reset_recording(self):
+        self.recorded = Counter()
+        self.queue_depth = Histogram()
+
+    def step(self, label, scheduled, late, duration):
+        self.counters[label] += 1
+        self.lateness.add(late)
+        self.call_time.add(duration)
+        for hook in self.hooks:
+            hook(label, scheduled, late, duration)
+
+    def drained(self, depth, events):
+        # depth: records claimed but not yet drained when the drain started
+        self.queue_depth.add(depth)
+        for event in events:
+            self.recorded['recorded_' + event['action']] += 1
+
+    def count(self, name, n=1):
+        self.counters[name] += n
+
+    def all_counters(self):
+        return {**self.counters, **self.recorded}
+
+    def to_dict(self):
+        return {
+            'counters': self.all_counters(),
+            'lateness_ms': self.lateness.summary(),
+            'call_time_ms': self.call_time.summary(),
+            'queue_depth': self.queue_depth.summary(scale=1),
+        }
+
+    def export_json(self, filename):
+        with open(filename, 'w') as f:
+            json.dump(self.to_dict(), f, indent=2)
+
+    def export_csv(self, filename):
+        # One row per counter and per non-empty histogram bucket
+        with open(filename, 'w', newline='') as f:
+            writer = csv.writer(f)
+            writer.writerow(['metric', 'low', 'high', 'count'])
+            for name, n in sorted(self.all_counters().items()):
+                writer.writerow([f'count.{name}', '', '', n])
+            for name in HISTOGRAMS:
+                histogram = getattr(self, name)
+                for index, n in enumerate(histogram.buckets):
+                    if n:
+                        low, high = histogram.bucket_bounds(index)
+                        writer.writerow([name, low, high, n])
@@ -0,0 +1,161 @@
+# library.py
+
+import io
+import json
+import os
+import sqlite3
+import time
+import zlib
+
+import recfile
+
+# One SQLite file holding many recordings. Each row keeps the summary used
+# for listing and searching next to a zlib-compressed binary .rec payload,
+# which is only read and decoded when a recording is loaded or exported.
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS macros (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE,
+    created REAL NOT NULL,
+    duration REAL NOT NULL,
+    events INTEGER NOT NULL,
+    counts TEXT NOT NULL,
+    keys TEXT NOT NULL,
+    buttons TEXT NOT NULL,
+    bounds TEXT,
+    size INTEGER NOT NULL,
+    payload BLOB NOT NULL
+);
+CREATE TABLE IF NOT EXISTS macro_keys (
+    macro INTEGER NOT NULL REFERENCES macros(id) ON DELETE CASCADE,
+    key TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS macro_keys_key ON macro_keys(key);
+CREATE INDEX IF NOT EXISTS macros_duration ON macros(duration);
+'''
+
+# Everything but the payload
+INFO = 'id, name, created, duration, events, counts, keys, buttons, bounds, size'
+COMPRESSION = 6
+
+
+class Library:
+    def __init__(self, path):
+        self.path = path
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA foreign_keys = ON')
+        self.db.executescript(SCHEMA)
+
+    def __len__(self):
+        return self.db.execute('SELECT COUNT(*) FROM macros').fetchone()[0]
+
+    def __contains__(self, name):
+        return self.db.execute('SELECT 1 FROM macros WHERE name = ?', (name,)).fetchone() is not None
+
+    def add(self, name, events, created=None, replace=False):
+        if not isinstance(events, (list, recfile.Recording)):
+            events = list(events)
+        summary = recfile.summarize(events)
+        buffer = io.BytesIO()
+        recfile.pack(buffer, events)
+        payload = zlib.compress(buffer.getvalue(), COMPRESSION)
+        with self.db:
+            if replace:
+                self.db.execute('DELETE FROM macros WHERE name = ?', (name,))
+            elif name in self:
+                raise ValueError(f"A macro named '{name}' is already in the library")
+            cursor = self.db.execute(
+                'INSERT INTO macros (name, created, duration, events, counts, keys, buttons, bounds, size, payload) '
+                'VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                (name, time.time() if created is None else created, summary['duration'], summary['events'],
+                 json.dumps(summary['counts']), json.dumps(summary['keys']), json.dumps(summary['buttons']),
+                 json.dumps(summary['bounds']), len(payload), payload))
+            self.db.executemany('INSERT INTO macro_keys (macro, key) VALUES (?, ?)',
+                                ((cursor.lastrowid, str(key)) for key in summary['keys']))
+        return cursor.lastrowid
+
+    def import_file(self, filename, name=None, replace=False):
+        # Named after the file and dated by its mtime unless told otherwise
+        if name is None:
+            name = os.path.splitext(os.path.basename(filename))[0]
+        events = recfile.load(filename)
+        try:
+            return self.add(name, events, os.stat(filename).st_mtime, replace)
+        finally:
+            if isinstance(events, recfile.Recording):
+                events.close()
+
+    def search(self, text=None, key=None, min_duration=None, max_duration=None, order='name'):
+        # Summaries of matching macros; no payload is touched
+        if order not in ('name', 'created', 'duration', 'events'):
+            raise ValueError(f"Cannot order macros by '{order}'")
+        where = []
+        params = []
+        if text:
+            where.append("name LIKE ? ESCAPE '\\'")
+            params.append('%' + text.replace('\\', '\\\\').replace('%', '\\%').replace('_', '\\_') + '%')
+        if key is not None:
+            where.append('id IN (SELECT macro FROM macro_keys WHERE key = ?)')
+            params.append(key)
+        if min_duration is not None:
+            where.append('duration >= ?')
+            params.append(min_duration)
+        if max_duration is not None:
+            where.append('duration <= ?')
+            params.append(max_duration)
+        query = f'SELECT {INFO} FROM macros'
+        if where:
+            query += ' WHERE ' + ' AND '.join(where)
+        rows = self.db.execute(query + f' ORDER BY {order}', params)
+        return [self.row_info(row) for row in rows]
+
+    def list(self, order='name'):
+        return self.search(order=order)
+
+    def info(self, name):
+        row = self.db.execute(f'SELECT {INFO} FROM macros WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        return self.row_info(row)
+
+    @staticmethod
+    def row_info(row):
+        id, name, created, duration, events, counts, keys, buttons, bounds, size = row
+        return {
+            'id': id,
+            'name': name,
+            'created': created,
+            'duration': duration,
+            'events': events,
+            'counts': json.loads(counts),
+            'keys': json.loads(keys),
+            'buttons': json.loads(buttons),
+            'bounds': json.loads(bounds),
+            'size': size,
+        }
+
+    def load(self, name):
+        # Decompressed into memory; the columns are viewed over that buffer
+        row = self.db.execute('SELECT payload FROM macros WHERE name = ?', (name,)).fetchone()
+        if row is None:
+            raise KeyError(name)
+        columns, names = recfile.unpack(zlib.decompress(row[0]), name)
+        return recfile.Recording(columns, names)
+
+    def export(self, name, filename, format='binary'):
+        recfile.save(filename, self.load(name), format)
+
+    def rename(self, name, new_name):
+        if new_name in self:
+            raise ValueError(f"A macro named '{new_name}' is already in the library")
+        with self.db:
+            if self.db.execute('UPDATE macros SET name = ? WHERE name = ?', (new_name, name)).rowcount == 0:
+                raise KeyError(name)
+
+    def remove(self, name):
+        with self.db:
+            if self.db.execute('DELETE FROM macros WHERE name = ?', (name,)).rowcount == 0:
+                raise KeyError(name)
+
+    def close(self):
+        self.db.close()
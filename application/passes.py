@@ -0,0 +1,293 @@
+# passes.py
+
+from bisect import bisect_right
+from math import hypot
+
+import recfile
+
+
+def _rdp(xs, ys, keep, first, last, tolerance):
+    # Ramer-Douglas-Peucker over points first..last, marking survivors in keep
+    stack = [(first, last)]
+    while stack:
+        a, b = stack.pop()
+        ax, ay = xs[a], ys[a]
+        dx, dy = xs[b] - ax, ys[b] - ay
+        norm = hypot(dx, dy)
+        best, index = tolerance, None
+        for i in range(a + 1, b):
+            if norm:
+                distance = abs(dy * (xs[i] - ax) - dx * (ys[i] - ay)) / norm
+            else:
+                distance = hypot(xs[i] - ax, ys[i] - ay)
+            if distance > best:
+                best, index = distance, i
+        if index is not None:
+            keep[index] = True
+            stack.append((a, index))
+            stack.append((index, b))
+
+
+def _simplify_run(run, tolerance, max_gap):
+    if len(run) < 3:
+        return run
+    xs = [event['x'] for event in run]
+    ys = [event['y'] for event in run]
+    keep = [False] * len(run)
+    keep[0] = keep[-1] = True
+    _rdp(xs, ys, keep, 0, len(run) - 1, tolerance)
+
+    # Put back points wherever dropping them would leave the cursor idle for
+    # longer than max_gap, so the path keeps its original pacing
+    if max_gap is not None:
+        last = 0
+        for i in range(1, len(run)):
+            if keep[i]:
+                last = i
+            elif run[i + 1]['time'] - run[last]['time'] > max_gap:
+                keep[i] = True
+                last = i
+    return [event for event, kept in zip(run, keep) if kept]
+
+
+def simplify_moves(events, tolerance=1.0, max_gap=0.05):
+    # Drop mouse moves that lie within `tolerance` pixels of the simplified
+    # path. Clicks, scrolls and key events are kept untouched and in order;
+    # each run of moves between them keeps its first and last point.
+    # Returns the new event list and the fraction of events removed.
+    result = []
+    run = []
+    total = 0
+    for event in events:
+        total += 1
+        if event['type'] == 'mouse' and event['action'] == 'move':
+            run.append(event)
+            continue
+        if run:
+            result.extend(_simplify_run(run, tolerance, max_gap))
+            run = []
+        result.append(event)
+    if run:
+        result.extend(_simplify_run(run, tolerance, max_gap))
+    ratio = 1 - len(result) / total if total else 0.0
+    return result, ratio
+
+
+def _hermite(p0, p1, p2, p3, t0, t1, t2, t3, t):
+    # Cubic Hermite between p1 at t1 and p2 at t2, with Catmull-Rom tangents
+    # taken over the neighbouring samples' actual times
+    h = t2 - t1
+    u = (t - t1) / h
+    m1 = (p2 - p0) / (t2 - t0) * h if t2 > t0 else 0.0
+    m2 = (p3 - p1) / (t3 - t1) * h if t3 > t1 else 0.0
+    u2 = u * u
+    u3 = u2 * u
+    return ((2 * u3 - 3 * u2 + 1) * p1 + (u3 - 2 * u2 + u) * m1
+            + (-2 * u3 + 3 * u2) * p2 + (u3 - u2) * m2)
+
+
+def _resample_run(run, period, spline):
+    if len(run) < 2:
+        return run
+    ts = [event['time'] for event in run]
+    xs = [event['x'] for event in run]
+    ys = [event['y'] for event in run]
+    low_x, high_x, low_y, high_y = min(xs), max(xs), min(ys), max(ys)
+    last = len(run) - 1
+    result = []
+    i = 0
+    step = 0
+    end = ts[last] - period / 2
+    t = ts[0]
+    while t < end:
+        # Advance to the segment ts[i] <= t < ts[i + 1]
+        while ts[i + 1] <= t:
+            i += 1
+        h = ts[i + 1] - ts[i]
+        if spline:
+            a, d = max(i - 1, 0), min(i + 2, last)
+            x = _hermite(xs[a], xs[i], xs[i + 1], xs[d], ts[a], ts[i], ts[i + 1], ts[d], t)
+            y = _hermite(ys[a], ys[i], ys[i + 1], ys[d], ts[a], ts[i], ts[i + 1], ts[d], t)
+            # Spline overshoot never takes the cursor outside the run's extent
+            x = min(max(x, low_x), high_x)
+            y = min(max(y, low_y), high_y)
+        else:
+            u = (t - ts[i]) / h
+            x = xs[i] + (xs[i + 1] - xs[i]) * u
+            y = ys[i] + (ys[i + 1] - ys[i]) * u
+        result.append({'type': 'mouse', 'action': 'move', 'x': round(x), 'y': round(y), 'time': t})
+        step += 1
+        t = ts[0] + step * period
+    result.append(run[last])
+    return result
+
+
+def resample_moves(events, rate=120.0, method='linear', max_gap=0.25):
+    # Replace each run of mouse moves with moves on a fixed `rate` Hz grid,
+    # interpolated linearly or with a Catmull-Rom spline. Runs end at any
+    # other event and at pauses longer than `max_gap` seconds, so the cursor
+    # still rests where it rested and reaches every click exactly. Each run
+    # keeps its first and last original point.
+    if method not in ('linear', 'spline'):
+        raise ValueError(f"Unknown interpolation '{method}', expected 'linear' or 'spline'")
+    if rate <= 0:
+        raise ValueError(f"Resampling rate must be positive, got {rate}")
+    period = 1.0 / rate
+    spline = method == 'spline'
+    run = []
+    for event in events:
+        if event['type'] == 'mouse' and event['action'] == 'move':
+            if run and event['time'] - run[-1]['time'] > max_gap:
+                yield from _resample_run(run, period, spline)
+                run = []
+            run.append(event)
+            continue
+        if run:
+            yield from _resample_run(run, period, spline)
+            run = []
+        yield event
+    if run:
+        yield from _resample_run(run, period, spline)
+
+
+def coalesce(events, autorepeat=True, scroll_window=0.05, same_moves=True):
+    # Normalize a recording as it streams past:
+    #   autorepeat     drop repeated presses of a key that is already down,
+    #                  leaving a single press, the hold and the release
+    #   scroll_window  merge consecutive scrolls at the same spot within this
+    #                  many seconds of the first into one summed scroll
+    #                  (None disables merging)
+    #   same_moves     drop moves to where the cursor already is
+    held = set()
+    position = None
+    scroll = None
+    for event in events:
+        if scroll is not None:
+            if (event['type'] == 'mouse' and event['action'] == 'scroll'
+                    and (event['x'], event['y']) == (scroll['x'], scroll['y'])
+                    and event['time'] - scroll['time'] <= scroll_window):
+                scroll['dx'] += event['dx']
+                scroll['dy'] += event['dy']
+                continue
+            yield scroll
+            scroll = None
+
+        if event['type'] == 'keyboard':
+            if autorepeat:
+                if event['action'] == 'press':
+                    if event['key'] in held:
+                        continue
+                    held.add(event['key'])
+                elif event['action'] == 'release':
+                    held.discard(event['key'])
+            yield event
+            continue
+
+        point = (event['x'], event['y'])
+        if event['action'] == 'move':
+            if same_moves and point == position:
+                continue
+        elif event['action'] == 'scroll':
+            # The player scrolls wherever the cursor is and never moves it
+            # there, so a scroll does not make the next move redundant
+            if scroll_window is not None:
+                scroll = dict(event)
+                continue
+            yield event
+            continue
+        position = point
+        yield event
+    if scroll is not None:
+        yield scroll
+
+
+def _signature(event):
+    # What must match exactly for two events to count as the same step
+    if event['type'] == 'keyboard':
+        return ('key', event['action'], event['key'])
+    if event['action'] == 'click':
+        return ('click', event['button'], event['pressed'])
+    if event['action'] == 'scroll':
+        return ('scroll', event['dx'], event['dy'])
+    return ('move',)
+
+
+def _iterations(events, signatures, start, length, position_tolerance, time_tolerance):
+    # How many back-to-back copies of events[start:start + length] begin at
+    # `start`, comparing each copy with the first: same signatures, cursor
+    # within position_tolerance pixels, timing relative to the copy's start
+    # within time_tolerance seconds, and copies evenly spaced
+    first = events[start]['time']
+    period = None
+    count = 1
+    begin = start + length
+    while begin + length <= len(events):
+        base = events[begin]['time']
+        if period is None:
+            period = base - first
+        elif abs(base - events[begin - length]['time'] - period) > time_tolerance:
+            break
+        for j in range(length):
+            a, b = events[start + j], events[begin + j]
+            if signatures[start + j] != signatures[begin + j]:
+                break
+            if abs(b['time'] - base - (a['time'] - first)) > time_tolerance:
+                break
+            if a['type'] == 'mouse' and (abs(a['x'] - b['x']) > position_tolerance
+                                         or abs(a['y'] - b['y']) > position_tolerance):
+                break
+        else:
+            count += 1
+            begin += length
+            continue
+        break
+    return count
+
+
+def compact_loops(events, min_repeats=3, max_length=512, position_tolerance=3, time_tolerance=0.02, candidates=8):
+    # Replace runs of at least `min_repeats` back-to-back copies of the same
+    # event sequence with loop blocks (see recfile.expand_loops). Copies
+    # must match as in _iterations(); the block replays the first copy
+    # every `period` seconds, so positions and timing within the tolerances
+    # are not kept. Candidate lengths are the distances to the next few
+    # occurrences of the first click or key event, which keeps the search
+    # linear. Recordings whose repetitions have differing numbers of moves
+    # compact better after resample_moves(). Returns the new event list and
+    # the fraction of top-level entries removed.
+    events = list(recfile.expand_loops(events))
+    signatures = [_signature(event) for event in events]
+    occurrences = {}
+    for i, signature in enumerate(signatures):
+        occurrences.setdefault(signature, []).append(i)
+
+    result = []
+    i = 0
+    anchor = 0
+    while i < len(events):
+        # The first non-move event at or after i anchors the candidate lengths
+        anchor = max(anchor, i)
+        while anchor < len(events) and signatures[anchor] == ('move',) and anchor - i < max_length:
+            anchor += 1
+        if anchor == len(events) or anchor - i >= max_length:
+            anchor = i
+        seen = occurrences[signatures[anchor]]
+        best_count, best_length = 1, 0
+        for k in range(bisect_right(seen, anchor), min(bisect_right(seen, anchor) + candidates, len(seen))):
+            length = seen[k] - anchor
+            if length > max_length or i + length * min_repeats > len(events):
+                break
+            count = _iterations(events, signatures, i, length, position_tolerance, time_tolerance)
+            if count >= min_repeats and count * length > best_count * best_length:
+                best_count, best_length = count, length
+        if not best_length:
+            result.append(events[i])
+            i += 1
+            continue
+        body = events[i:i + best_length]
+        last = i + (best_count - 1) * best_length
+        result.append({'type': 'loop', 'time': body[0]['time'], 'count': best_count,
+                       'period': (events[last]['time'] - body[0]['time']) / (best_count - 1), 'events': body})
+        i += best_count * best_length
+    ratio = 1 - len(result) / len(events) if events else 0.0
+    return result, ratio
+
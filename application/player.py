@@ -1,105 +1,476 @@
 # player.py
 
-import json
+import heapq
+import itertools
+import threading
+from functools import partial
+from operator import itemgetter
 from pynput import mouse, keyboard
-import time
+from time import perf_counter_ns
+
+import recfile
+from scheduler import Scheduler
+from seek import SeekIndex
+from passes import coalesce, resample_moves
+
+# Special key names as recorded, each played as the pynput Key of that name.
+# Resolving names needs no controllers, so recordings can be checked
+# without a display.
+SPECIAL_KEY_NAMES = (
+    'space', 'esc', 'enter', 'backspace', 'delete', 'f1', 'f2', 'f3', 'f4', 'f5', 'f6', 'f7', 'f8',
+    'f9', 'f10', 'f11', 'f12', 'print_screen', 'home', 'tab', 'page_up', 'page_down', 'caps_lock',
+    'shift', 'shift_r', 'end', 'right', 'down', 'up', 'left', 'ctrl_r', 'alt_gr', 'alt_l', 'cmd',
+    'ctrl_l', 'insert', 'num_lock',
+)
+SPECIAL_KEYS = {name: getattr(keyboard.Key, name) for name in SPECIAL_KEY_NAMES}
+
+
+def resolve_key(key, mapping=SPECIAL_KEYS):
+    if key in mapping:
+        return mapping[key]
+    if isinstance(key, str) and len(key) == 1:
+        return key
+    return None
+
+
+def resolve_button(name):
+    return mouse.Button.__members__.get(name)
+
+
+class Repeat:
+    # A compiled loop block: `count` copies of `steps` (offsets relative to
+    # the block start), one every `period_ns`
+    def __init__(self, steps, count, period_ns):
+        self.steps = tuple(steps)
+        self.count = count
+        self.period_ns = period_ns
+        self.duration_ns = (count - 1) * period_ns + (self.steps[-1][0] if self.steps else 0)
+
+
+class Plan:
+    # A recording compiled for one Player: a flat tuple of
+    # (offset_ns, call, arg) steps, built once and replayed as often as needed.
+    # Loop blocks stay compact as (offset_ns, Repeat, repeat) steps and are
+    # only expanded while iterating.
+    def __init__(self, steps, invalid):
+        self.steps = tuple(steps)
+        self.invalid = tuple(invalid)
+        self.duration_ns = 0
+        if self.steps:
+            offset, call, arg = self.steps[-1]
+            self.duration_ns = offset + arg.duration_ns if call is Repeat else offset
+
+    def __len__(self):
+        return len(self.steps)
+
+    def __iter__(self):
+        for step in self.steps:
+            if step[1] is not Repeat:
+                yield step
+                continue
+            start, _, repeat = step
+            for iteration in range(repeat.count):
+                base = start + iteration * repeat.period_ns
+                for offset, call, arg in repeat.steps:
+                    yield base + offset, call, arg
+
+
+class Timeline:
+    # Maps recorded event times onto playback offsets, applying the speed
+    # factor and gap cap, or dropping gaps entirely in fast mode. Click and
+    # key holds are stretched to at least min_click / min_hold seconds so the
+    # target application still registers them.
+    def __init__(self, start_time, speed=1.0, max_gap=None, fast=False, min_click=0.0, min_hold=0.0):
+        if not 0.25 <= speed <= 20:
+            raise ValueError(f"Playback speed must be between 0.25x and 20x, got {speed}")
+        self.last_time = start_time
+        self.last_offset = 0.0
+        self.speed = speed
+        self.max_gap = max_gap
+        self.fast = fast
+        self.min_click = min_click
+        self.min_hold = min_hold
+        self.held = {}
+
+    def gap(self, gap):
+        # Playback seconds for `gap` seconds of recording
+        if self.fast or gap < 0:
+            return 0.0
+        gap /= self.speed
+        if self.max_gap is not None and gap > self.max_gap:
+            return self.max_gap
+        return gap
+
+    def offset(self, event):
+        offset = self.last_offset + self.gap(event['time'] - self.last_time)
+        self.last_time = event['time']
+
+        action = event['action']
+        if action == 'click':
+            held = ('button', event['button'])
+            if event['pressed']:
+                self.held[held] = offset
+            elif held in self.held:
+                offset = max(offset, self.held.pop(held) + self.min_click)
+        elif action == 'press':
+            # OS autorepeat sends more presses; the hold starts at the first
+            self.held.setdefault(('key', event['key']), offset)
+        elif action == 'release':
+            held = ('key', event['key'])
+            if held in self.held:
+                offset = max(offset, self.held.pop(held) + self.min_hold)
+
+        self.last_offset = offset
+        return int(offset * 1e9)
+
+
+class Track:
+    # One layer of a multi-track playback: a recording placed `offset`
+    # seconds into the shared timeline and played at `speed` relative to it.
+    # Disabled tracks stay in the list but are left out when compiling.
+    def __init__(self, events, offset=0.0, speed=1.0, enabled=True, name=None):
+        if offset < 0:
+            raise ValueError(f"Track offset must not be negative, got {offset}")
+        self.events = events
+        self.offset = offset
+        self.speed = speed
+        self.enabled = enabled
+        self.name = name
+
 
 class Player:
-    def __init__(self):
+    def __init__(self, cache=None):
         self.mouse_controller = mouse.Controller()
         self.keyboard_controller = keyboard.Controller()
         self.events = []
+        self.plan = None
+        self.cache = cache
         self.playing = False
+        self.cancel = threading.Event()
+        # Guards `playing` and `cancel` together, so a stop racing the end of
+        # a run cannot leave `cancel` set for the next one
+        self.lock = threading.Lock()
+        self.scheduler = Scheduler(cancel=self.cancel)
+        self.lateness = None
+        self.instruments = None
 
-        # Mapping special key names to pynput key codes
-        self.special_key_mapping = {
-            'space': keyboard.Key.space,
-            'esc': keyboard.Key.esc,
-            'enter': keyboard.Key.enter,
-            'backspace': keyboard.Key.backspace,
-            'delete': keyboard.Key.delete,
-            'f1': keyboard.Key.f1,
-            'f2': keyboard.Key.f2,
-            'f3': keyboard.Key.f3,
-            'f4': keyboard.Key.f4,
-            'f5': keyboard.Key.f5,
-            'f6': keyboard.Key.f6,
-            'f7': keyboard.Key.f7,
-            'f8': keyboard.Key.f8,
-            'f9': keyboard.Key.f9,
-            'f10': keyboard.Key.f10,
-            'f11': keyboard.Key.f11,
-            'f12': keyboard.Key.f12,
-            'print_screen': keyboard.Key.print_screen,
-            'home': keyboard.Key.home,
-            'tab': keyboard.Key.tab,
-            'page_up': keyboard.Key.page_up,
-            'page_down': keyboard.Key.page_down,
-            'caps_lock': keyboard.Key.caps_lock,
-            'shift': keyboard.Key.shift,
-            'shift_r': keyboard.Key.shift_r,
-            'end': keyboard.Key.end,
-            'right': keyboard.Key.right,
-            'down': keyboard.Key.down,
-            'up': keyboard.Key.up,
-            'left': keyboard.Key.left,
-            'ctrl_r': keyboard.Key.ctrl_r,
-            'alt_gr': keyboard.Key.alt_gr,
-            'alt_l': keyboard.Key.alt_l,
-            'cmd': keyboard.Key.cmd,
-            'ctrl_l': keyboard.Key.ctrl_l,
-            'insert': keyboard.Key.insert,
-            # Add numpad keys
-            'num_lock': keyboard.Key.num_lock,
+        # Controller calls are bound once so compiled steps can share them and
+        # instrumentation can label a step by its call
+        self.set_position = partial(setattr, self.mouse_controller, 'position')
+        self.step_labels = {
+            self.set_position: 'move',
+            self.mouse_controller.press: 'click_press',
+            self.mouse_controller.release: 'click_release',
+            self.scroll: 'scroll',
+            self.keyboard_controller.press: 'key_press',
+            self.keyboard_controller.release: 'key_release',
         }
 
-    def play(self, events):
-        self.playing = True
-        if not events:
-            return
+        # Playback timing options, applied when a recording is compiled
+        self.speed = 1.0
+        self.max_gap = None
+        self.fast = False
+        self.min_click = 0.0
+        self.min_hold = 0.0
 
-        start_time = events[0]['time']
-        for event in events:
-            if not self.playing:
-                break
-            elapsed = event['time'] - start_time
-            time.sleep(elapsed)
-            start_time = event['time']
+        # Normalize autorepeat, scroll bursts and redundant moves while compiling
+        self.coalesce = False
+        self.scroll_window = 0.05
+
+        # Replay mouse paths at a fixed rate in Hz (None keeps recorded moves)
+        self.resample = None
+        self.interpolation = 'linear'
+
+        # Mapping special key names to pynput key codes
+        self.special_key_mapping = dict(SPECIAL_KEYS)
+
+    def scroll(self, delta):
+        self.mouse_controller.scroll(*delta)
+
+    def resolve_key(self, key):
+        return resolve_key(key, self.special_key_mapping)
+
+    def normalize(self, events, speed=None):
+        # `speed` is the playback speed the events will be timed at
+        if not isinstance(events, recfile.Recording):
+            events = recfile.expand_loops(events)
+        if self.coalesce:
+            events = coalesce(events, scroll_window=self.scroll_window)
+        if self.resample:
+            # The grid is laid out in recorded time; scale it so playback
+            # moves the cursor `resample` times a second whatever the speed
+            events = resample_moves(events, self.resample / (self.speed if speed is None else speed),
+                                    self.interpolation)
+        return events
+
+    def timeline(self, start_time):
+        return Timeline(start_time, self.speed, self.max_gap, self.fast, self.min_click, self.min_hold)
 
+    def iter_steps(self, events, timeline, invalid=None):
+        # Turn events into (offset_ns, call, arg) steps with every key and
+        # button already resolved. Unresolvable events are skipped and
+        # reported through `invalid` as (index, key or button) pairs.
+        set_position = self.set_position
+        mouse_press = self.mouse_controller.press
+        mouse_release = self.mouse_controller.release
+        scroll = self.scroll
+        key_press = self.keyboard_controller.press
+        key_release = self.keyboard_controller.release
+
+        for index, event in enumerate(events):
+            offset = timeline.offset(event)
             if event['type'] == 'mouse':
                 if event['action'] == 'move':
-                    self.mouse_controller.position = (event['x'], event['y'])
+                    yield offset, set_position, (event['x'], event['y'])
                 elif event['action'] == 'click':
-                    self.mouse_controller.position = (event['x'], event['y'])
-                    if event['pressed']:
-                        self.mouse_controller.press(mouse.Button[event['button']])
-                    else:
-                        self.mouse_controller.release(mouse.Button[event['button']])
+                    button = resolve_button(event['button'])
+                    if button is None:
+                        if invalid is not None:
+                            invalid.append((index, event['button']))
+                        continue
+                    yield offset, set_position, (event['x'], event['y'])
+                    yield offset, mouse_press if event['pressed'] else mouse_release, button
                 elif event['action'] == 'scroll':
-                    self.mouse_controller.scroll(event['dx'], event['dy'])
+                    yield offset, scroll, (event['dx'], event['dy'])
             elif event['type'] == 'keyboard':
+                key = self.resolve_key(event['key'])
+                if key is None:
+                    if invalid is not None:
+                        invalid.append((index, event['key']))
+                    continue
                 if event['action'] == 'press':
-                    key = event['key']
-                    if key in self.special_key_mapping:
-                        self.keyboard_controller.press(self.special_key_mapping[key])
-                    elif len(key) == 1:
-                        self.keyboard_controller.press(key)
-                    else:
-                        print(f"Invalid key character '{key}'")
+                    yield offset, key_press, key
                 elif event['action'] == 'release':
-                    key = event['key']
-                    if key in self.special_key_mapping:
-                        self.keyboard_controller.release(self.special_key_mapping[key])
-                    elif len(key) == 1:
-                        self.keyboard_controller.release(key)
-                    else:
-                        print(f"Invalid key character '{key}'")
+                    yield offset, key_release, key
 
-        self.playing = False
+    def compile(self, events, strict=False):
+        if isinstance(events, Plan):
+            return events
+        if not events:
+            return Plan((), [])
+        invalid = []
+        timeline = self.timeline(events[0]['time'])
+        if recfile.has_loops(events):
+            plan = Plan(self.loop_steps(events, timeline, invalid), invalid)
+        else:
+            plan = Plan(self.iter_steps(self.normalize(events), timeline, invalid), invalid)
+        self.report_invalid(invalid, strict)
+        return plan
+
+    def loop_steps(self, events, timeline, invalid):
+        # Steps for a recording with loop blocks. Plain runs are compiled as
+        # usual; each block body is compiled once on its own timeline and
+        # kept as a Repeat step. Invalid events inside a block are reported
+        # at the block's index.
+        first = 0
+        for index, event in enumerate(events + [None]):
+            if event is not None and event['type'] != 'loop':
+                continue
+            if first < index:
+                run_invalid = []
+                yield from self.iter_steps(self.normalize(events[first:index]), timeline, run_invalid)
+                invalid.extend((first + i, key) for i, key in run_invalid)
+            first = index + 1
+            if event is None:
+                break
+
+            body = list(self.normalize(event['events']))
+            body_timeline = self.timeline(body[0]['time'])
+            body_invalid = []
+            steps = list(self.iter_steps(body, body_timeline, body_invalid))
+            invalid.extend((index, key) for _, key in body_invalid)
+            start = timeline.last_offset + timeline.gap(event['time'] - timeline.last_time)
+            # Copies are spaced by the body plus the recorded gap after it
+            span = body[-1]['time'] - body[0]['time']
+            period = body_timeline.last_offset + timeline.gap(event['period'] - span)
+            yield int(start * 1e9), Repeat, Repeat(steps, event['count'], int(period * 1e9))
+            timeline.last_time = event['time'] + (event['count'] - 1) * event['period'] + span
+            timeline.last_offset = start + (event['count'] - 1) * period + body_timeline.last_offset
+
+    def report_invalid(self, invalid, strict):
+        if invalid:
+            keys = ', '.join(sorted({repr(key) for _, key in invalid}))
+            if strict:
+                raise ValueError(f"Invalid keys in recording: {keys}")
+            print(f"Skipping {len(invalid)} events with invalid keys: {keys}")
+
+    def compile_tracks(self, tracks, strict=False):
+        # Merge every enabled track into one plan, ordered by offset with a
+        # k-way heap merge of the already sorted per-track steps, so layers
+        # share a single timeline and timing loop. Invalid events are
+        # reported as ((track number, index), key) pairs.
+        invalid = []
+        streams = [self.track_steps(number, track, invalid)
+                   for number, track in enumerate(tracks) if track.enabled and len(track.events)]
+        plan = Plan(heapq.merge(*streams, key=itemgetter(0)), invalid)
+        self.report_invalid(invalid, strict)
+        return plan
+
+    def track_steps(self, number, track, invalid):
+        # Player options apply to every track; track speed multiplies the
+        # player's, and the offset is scaled with the shared timeline
+        shift = 0 if self.fast else int(track.offset / self.speed * 1e9)
+        speed = self.speed * track.speed
+        timeline = Timeline(track.events[0]['time'], speed, self.max_gap, self.fast, self.min_click, self.min_hold)
+        track_invalid = []
+        for offset, call, arg in self.iter_steps(self.normalize(track.events, speed), timeline, track_invalid):
+            yield offset + shift, call, arg
+        invalid.extend(((number, i), key) for i, key in track_invalid)
+
+    def compile_range(self, events, start=0.0, end=None, index=None, strict=False):
+        # Compile the events from `start` to `end` seconds into the recording.
+        # The plan first restores the keys, buttons and cursor position in
+        # effect at `start`, then carries on along the original timeline and
+        # ends by releasing anything still held at `end`.
+        if index is None:
+            index = SeekIndex(events)
+        if not len(index):
+            return Plan((), [])
+        first = index.locate(start)
+        last = index.locate_end(end) if end is not None else len(index)
+        keys, buttons, position = index.state_at(first)
+
+        restore = []
+        if position is not None:
+            restore.append((0, self.set_position, position))
+        for key in sorted(keys, key=str):
+            resolved = self.resolve_key(key)
+            if resolved is not None:
+                restore.append((0, self.keyboard_controller.press, resolved))
+        for button in sorted(buttons):
+            resolved = resolve_button(button)
+            if resolved is not None:
+                restore.append((0, self.mouse_controller.press, resolved))
+
+        invalid = []
+        events = index.events
+        window = self.normalize(events[i] for i in range(first, last))
+        steps = self.iter_steps(window, self.timeline(index.start_time + start), invalid)
+        steps = list(itertools.chain(restore, steps))
+
+        # Let go of whatever is still held where the window ends, as a
+        # completed run releases nothing by itself
+        keys, buttons, _ = index.state_at(max(first, last))
+        offset = steps[-1][0] if steps else 0
+        for button in sorted(buttons):
+            resolved = resolve_button(button)
+            if resolved is not None:
+                steps.append((offset, self.mouse_controller.release, resolved))
+        for key in sorted(keys, key=str):
+            resolved = self.resolve_key(key)
+            if resolved is not None:
+                steps.append((offset, self.keyboard_controller.release, resolved))
+        plan = Plan(steps, [(first + i, key) for i, key in invalid])
+        self.report_invalid(invalid, strict)
+        return plan
+
+    def play(self, events, repeat=1):
+        # repeat=0 loops until stopped
+        self.playing = True
+        plan = self.compile(events)
+        self.run(iter(plan) if repeat == 1 else self.looped(lambda: plan, repeat))
+        if self.instruments is not None:
+            self.instruments.count('skipped', len(plan.invalid))
+
+    def play_stream(self, filename, chunk_size=4096, repeat=1):
+        # Start playing as soon as the first chunk is decoded; the rest of the
+        # file is read ahead on a background thread
+        self.playing = True
+        invalid = []
+        self.run(self.looped(lambda: self.stream_steps(recfile.stream(filename, chunk_size), invalid), repeat))
+        if self.instruments is not None:
+            self.instruments.count('skipped', len(invalid))
+        self.report_invalid(invalid, False)
+
+    def stream_steps(self, chunks, invalid):
+        events = self.normalize(event for chunk in chunks for event in chunk)
+        first = next(events, None)
+        if first is None:
+            return
+        yield from self.iter_steps(itertools.chain([first], events), self.timeline(first['time']), invalid)
+
+    def looped(self, make_steps, repeat):
+        # Iterations run back to back: each one starts where the previous
+        # one's last event fired, on the same scheduler timeline
+        base = 0
+        iteration = 0
+        while self.playing and (not repeat or iteration < repeat):
+            offset = None
+            for offset, call, arg in make_steps():
+                yield base + offset, call, arg
+            if offset is None:
+                return
+            base += offset
+            iteration += 1
+
+    def run(self, steps):
+        scheduler = self.scheduler
+        instruments = self.instruments
+        if instruments is not None:
+            instruments.reset_playback()
+            labels = self.step_labels
+
+        # Track what is held down so an aborted run can let go of it
+        buttons = set()
+        keys = set()
+        holds = {
+            self.mouse_controller.press: buttons.add,
+            self.mouse_controller.release: buttons.discard,
+            self.keyboard_controller.press: keys.add,
+            self.keyboard_controller.release: keys.discard,
+        }
+
+        # A stop requested before the run got going still counts
+        completed = False
+        scheduler.start()
+        try:
+            if not self.cancel.is_set():
+                for offset, call, arg in steps:
+                    if not self.playing:
+                        break
+                    late = scheduler.wait(offset)
+                    if late is None:
+                        break
+                    if instruments is None:
+                        call(arg)
+                    else:
+                        start = perf_counter_ns()
+                        call(arg)
+                        instruments.step(labels.get(call, 'other'), offset, late, perf_counter_ns() - start)
+                    if call in holds:
+                        holds[call](arg)
+                else:
+                    completed = True
+        finally:
+            if not completed:
+                for key in keys:
+                    self.keyboard_controller.release(key)
+                for button in buttons:
+                    self.mouse_controller.release(button)
+            self.lateness = scheduler.stats
+            with self.lock:
+                self.playing = False
+                self.cancel.clear()
 
     def stop(self):
-        self.playing = False
+        # Wakes the scheduler immediately, even in the middle of a long gap
+        with self.lock:
+            if self.playing:
+                self.cancel.set()
+            self.playing = False
 
     def load(self, filename):
-        with open(filename, 'r') as f:
-            self.events = json.load(f)
+        self.close()
+        if self.cache is not None:
+            self.events, self.plan = self.cache.plan(filename, self)
+            return
+        self.events = recfile.load(filename)
+        self.plan = self.compile(self.events)
+
+    def close(self):
+        # Binary recordings keep their file mapped until closed; cached ones
+        # are closed by the cache when evicted
+        if self.cache is None and isinstance(self.events, recfile.Recording):
+            self.events.close()
+        self.events = []
+        self.plan = None
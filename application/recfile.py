@@ -0,0 +1,427 @@
+# recfile.py
+
+import json
+import mmap
+import os
+import queue
+import struct
+import sys
+import threading
+from array import array
+
+# Binary .rec layout (little-endian):
+#   header   magic (8 bytes), version (u16), reserved (u16, written as 0
+#            and ignored on read), name table size (u32), event count (u64)
+#   names    JSON list of the button/key names referenced by the `code` column
+#   columns  one packed array per column, each padded to 8 bytes
+#
+# JSON recordings may also hold loop blocks written by passes.compact_loops:
+#   {'type': 'loop', 'time': t, 'count': n, 'period': p, 'events': [...]}
+# standing for `count` copies of `events` (timed as the first copy), each
+# starting `period` seconds after the previous one. The binary format has
+# no loop blocks; they are expanded when saving as binary.
+MAGIC = b'LWREC\x00\x00\x00'
+VERSION = 1
+HEADER = struct.Struct('<8sHHIQ')
+ALIGN = 8
+
+COLUMNS = (
+    ('time', 'q'),
+    ('x', 'i'),
+    ('y', 'i'),
+    ('dx', 'i'),
+    ('dy', 'i'),
+    ('code', 'i'),
+    ('kind', 'B'),
+    ('action', 'B'),
+    ('pressed', 'B'),
+)
+
+KINDS = ('mouse', 'keyboard')
+ACTIONS = ('move', 'click', 'scroll', 'press', 'release')
+KIND_IDS = {name: i for i, name in enumerate(KINDS)}
+ACTION_IDS = {name: i for i, name in enumerate(ACTIONS)}
+
+
+def _padding(size):
+    return -size % ALIGN
+
+
+class Recording:
+    # Read-only columnar view over a recording. Events are only turned into
+    # dicts when indexed or iterated, one at a time.
+    def __init__(self, columns, names, buffer=None):
+        self.columns = columns
+        self.names = names
+        self._buffer = buffer
+
+    def __len__(self):
+        return len(self.columns['time'])
+
+    def __getitem__(self, index):
+        if isinstance(index, slice):
+            return [self.event(i) for i in range(*index.indices(len(self)))]
+        if index < 0:
+            index += len(self)
+        if not 0 <= index < len(self):
+            raise IndexError('recording index out of range')
+        return self.event(index)
+
+    def __iter__(self):
+        for i in range(len(self)):
+            yield self.event(i)
+
+    def event(self, i):
+        c = self.columns
+        kind = KINDS[c['kind'][i]]
+        action = ACTIONS[c['action'][i]]
+        t = c['time'][i] / 1e9
+        if kind == 'keyboard':
+            return {'type': kind, 'action': action, 'key': self.names[c['code'][i]], 'time': t}
+        event = {'type': kind, 'action': action, 'x': c['x'][i], 'y': c['y'][i]}
+        if action == 'click':
+            event['button'] = self.names[c['code'][i]]
+            event['pressed'] = bool(c['pressed'][i])
+        elif action == 'scroll':
+            event['dx'] = c['dx'][i]
+            event['dy'] = c['dy'][i]
+        event['time'] = t
+        return event
+
+    def close(self):
+        if self._buffer is None:
+            return
+        for column in self.columns.values():
+            if isinstance(column, memoryview):
+                column.release()
+        self.columns = {name: array(code) for name, code in COLUMNS}
+        self._buffer.close()
+        self._buffer = None
+
+
+def to_columns(events):
+    columns = {name: array(code) for name, code in COLUMNS}
+    names = []
+    name_ids = {}
+
+    def name_id(name):
+        if name not in name_ids:
+            name_ids[name] = len(names)
+            names.append(name)
+        return name_ids[name]
+
+    append = {name: column.append for name, column in columns.items()}
+    for event in events:
+        append['time'](int(round(event['time'] * 1e9)))
+        append['kind'](KIND_IDS[event['type']])
+        append['action'](ACTION_IDS[event['action']])
+        append['x'](int(round(event.get('x', 0))))
+        append['y'](int(round(event.get('y', 0))))
+        append['dx'](int(round(event.get('dx', 0))))
+        append['dy'](int(round(event.get('dy', 0))))
+        append['pressed'](1 if event.get('pressed') else 0)
+        if 'key' in event:
+            append['code'](name_id(event['key']))
+        elif 'button' in event:
+            append['code'](name_id(event['button']))
+        else:
+            append['code'](-1)
+    return columns, names
+
+
+def pack(f, events):
+    # Write the binary layout to an open binary file object
+    if isinstance(events, Recording):
+        columns, names = events.columns, events.names
+    else:
+        columns, names = to_columns(expand_loops(events))
+    name_blob = json.dumps(names).encode('utf-8')
+    f.write(HEADER.pack(MAGIC, VERSION, 0, len(name_blob), len(columns['time'])))
+    f.write(name_blob + b'\x00' * _padding(HEADER.size + len(name_blob)))
+    for name, code in COLUMNS:
+        column = columns[name]
+        if isinstance(column, memoryview):
+            column = array(code, column)
+        if sys.byteorder == 'big':
+            column = array(code, column)
+            column.byteswap()
+        data = column.tobytes()
+        f.write(data + b'\x00' * _padding(len(data)))
+
+
+def write(filename, events):
+    # Written beside the target and moved into place, so a failed write
+    # leaves the old file whole and a reader still mapping it is not cut short
+    temp = filename + '.tmp'
+    try:
+        with open(temp, 'wb') as f:
+            pack(f, events)
+        os.replace(temp, filename)
+    except BaseException:
+        if os.path.exists(temp):
+            os.remove(temp)
+        raise
+
+
+def read(filename):
+    with open(filename, 'rb') as f:
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+    try:
+        columns, names = unpack(buffer, filename)
+    except ValueError:
+        buffer.close()
+        raise
+    return Recording(columns, names, buffer)
+
+
+def unpack(buffer, source='buffer'):
+    # Columns and names viewed in place over any bytes-like buffer
+    magic, version, _, names_size, count = HEADER.unpack_from(buffer, 0)
+    if magic != MAGIC:
+        raise ValueError(f"{source} is not a binary recording")
+    if version > VERSION:
+        raise ValueError(f"Unsupported recording version {version} in {source}")
+
+    offset = HEADER.size
+    names = json.loads(bytes(buffer[offset:offset + names_size]).decode('utf-8'))
+    offset += names_size + _padding(offset + names_size)
+
+    view = memoryview(buffer)
+    columns = {}
+    for name, code in COLUMNS:
+        size = struct.calcsize(code) * count
+        column = view[offset:offset + size].cast(code)
+        if sys.byteorder == 'big':
+            column = array(code, column)
+            column.byteswap()
+        columns[name] = column
+        offset += size + _padding(size)
+    view.release()
+    return columns, names
+
+
+def is_binary(filename):
+    with open(filename, 'rb') as f:
+        return f.read(len(MAGIC)) == MAGIC
+
+
+def read_journal(filename):
+    # Journals are append-only JSON lines written while recording. A torn
+    # final line left behind by a crash is ignored.
+    with open(filename, 'r') as f:
+        for line in f:
+            if not line.endswith('\n'):
+                return
+            try:
+                yield json.loads(line)
+            except ValueError:
+                return
+
+
+def is_journal(filename):
+    with open(filename, 'r') as f:
+        return f.read(64).lstrip().startswith('{')
+
+
+def expand_loops(events):
+    # Lazily flatten loop blocks into plain events
+    if isinstance(events, Recording):
+        yield from events
+        return
+    for event in events:
+        if event['type'] != 'loop':
+            yield event
+            continue
+        for iteration in range(event['count']):
+            shift = iteration * event['period']
+            for inner in expand_loops(event['events']):
+                if shift:
+                    inner = dict(inner, time=inner['time'] + shift)
+                yield inner
+
+
+def has_loops(events):
+    return isinstance(events, list) and any(event['type'] == 'loop' for event in events)
+
+
+def load(filename):
+    if is_binary(filename):
+        return read(filename)
+    if is_journal(filename):
+        return list(read_journal(filename))
+    with open(filename, 'r') as f:
+        return json.load(f)
+
+
+def _iter_json_list(f, chunk_size, block_size=1 << 20):
+    # Incrementally decode a legacy JSON list. Every item is an object, so an
+    # item cut off at the end of a block fails to decode rather than decoding
+    # to something shorter.
+    decoder = json.JSONDecoder()
+    text = f.read(block_size).lstrip()
+    if not text.startswith('['):
+        raise ValueError("Recording is not a JSON list")
+    pos = 1
+    eof = False
+    chunk = []
+    while True:
+        while pos < len(text) and text[pos] in ' \t\r\n,':
+            pos += 1
+        if pos < len(text) and text[pos] == ']':
+            break
+        try:
+            if pos >= len(text):
+                raise ValueError("Need more data")
+            event, pos = decoder.raw_decode(text, pos)
+        except ValueError:
+            if eof:
+                raise ValueError("Truncated JSON recording")
+            more = f.read(block_size)
+            eof = not more
+            text = text[pos:] + more
+            pos = 0
+            continue
+        chunk.append(event)
+        if len(chunk) >= chunk_size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_chunks(filename, chunk_size=4096):
+    # Yield the events of any supported recording as lists of at most
+    # chunk_size dicts, without holding the whole recording in memory
+    if is_binary(filename):
+        recording = read(filename)
+        try:
+            for start in range(0, len(recording), chunk_size):
+                yield recording[start:start + chunk_size]
+        finally:
+            recording.close()
+    elif is_journal(filename):
+        chunk = []
+        for event in read_journal(filename):
+            chunk.append(event)
+            if len(chunk) >= chunk_size:
+                yield chunk
+                chunk = []
+        if chunk:
+            yield chunk
+    else:
+        with open(filename, 'r') as f:
+            yield from _iter_json_list(f, chunk_size)
+
+
+class ReadAhead:
+    # Runs a chunk iterator on a background thread, keeping at most `depth`
+    # decoded chunks queued ahead of the consumer
+    END = object()
+
+    def __init__(self, chunks, depth=4):
+        self.queue = queue.Queue(depth)
+        self.closed = threading.Event()
+        self.thread = threading.Thread(target=self.fill, args=(chunks,), daemon=True)
+        self.thread.start()
+
+    def put(self, item):
+        while not self.closed.is_set():
+            try:
+                self.queue.put(item, timeout=0.1)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def fill(self, chunks):
+        try:
+            for chunk in chunks:
+                if not self.put(chunk):
+                    break
+        except Exception as e:
+            self.put(e)
+        finally:
+            if hasattr(chunks, 'close'):
+                chunks.close()
+        self.put(self.END)
+
+    def __iter__(self):
+        try:
+            while True:
+                item = self.queue.get()
+                if item is self.END:
+                    return
+                if isinstance(item, Exception):
+                    raise item
+                yield item
+        finally:
+            self.close()
+
+    def close(self):
+        self.closed.set()
+
+
+def stream(filename, chunk_size=4096, depth=4):
+    return ReadAhead(iter_chunks(filename, chunk_size), depth)
+
+
+def summarize(events):
+    # Duration, per-action counts, keys and buttons used and the screen area
+    # touched, computed in one pass without keeping the events around
+    counts = {}
+    keys = set()
+    buttons = set()
+    bounds = None
+    first = last = None
+    for event in expand_loops(events):
+        if first is None:
+            first = event['time']
+        last = event['time']
+        counts[event['action']] = counts.get(event['action'], 0) + 1
+        if event['type'] == 'keyboard':
+            keys.add(event['key'])
+            continue
+        if 'button' in event:
+            buttons.add(event['button'])
+        x, y = event['x'], event['y']
+        if bounds is None:
+            bounds = [x, y, x, y]
+        else:
+            bounds = [min(bounds[0], x), min(bounds[1], y), max(bounds[2], x), max(bounds[3], y)]
+    return {
+        'events': sum(counts.values()),
+        'start': first,
+        'duration': last - first if first is not None else 0.0,
+        'counts': counts,
+        'keys': sorted(keys, key=str),
+        'buttons': sorted(buttons),
+        'bounds': bounds,
+    }
+
+
+def save(filename, events, format='binary'):
+    if format == 'binary':
+        write(filename, events)
+    elif format == 'json':
+        # Same output as json.dump(list(events)), without building the list
+        with open(filename, 'w') as f:
+            f.write('[')
+            separator = ''
+            for event in events:
+                f.write(separator + json.dumps(event))
+                separator = ', '
+            f.write(']')
+    else:
+        raise ValueError(f"Unknown recording format '{format}'")
+
+
+def convert(source, destination, format=None):
+    # Without an explicit format, convert to whichever format the source is not
+    if format is None:
+        format = 'json' if is_binary(source) else 'binary'
+    events = load(source)
+    try:
+        save(destination, events, format)
+    finally:
+        if isinstance(events, Recording):
+            events.close()
@@ -1,53 +1,119 @@
 # recorder.py
 
 import json
+import os
+import threading
 from pynput import mouse, keyboard
 import time
+from time import perf_counter_ns
+
+import recfile
+from passes import simplify_moves, coalesce, compact_loops
+from capture import RingBuffer, MOVE, CLICK, SCROLL, PRESS, RELEASE
 
 class Recorder:
-    def __init__(self):
+    def __init__(self, capacity=65536, batch_size=1024, fsync_interval=1.0, poll_interval=0.01):
         self.mouse_listener = None
         self.keyboard_listener = None
         self.events = []
         self.recording = False
 
-    def on_click(self, x, y, button, pressed):
-        if self.recording:
-            event = {'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': button.name, 'pressed': pressed, 'time': time.time()}
-            self.events.append(event)
-
-    def on_move(self, x, y):
-        if self.recording:
-            event = {'type': 'mouse', 'action': 'move', 'x': x, 'y': y, 'time': time.time()}
-            self.events.append(event)
-
-    def on_scroll(self, x, y, dx, dy):
-        if self.recording:
-            event = {'type': 'mouse', 'action': 'scroll', 'x': x, 'y': y, 'dx': dx, 'dy': dy, 'time': time.time()}
-            self.events.append(event)
-
-    def on_press(self, key):
-        if self.recording:
-            try:
-                event = {'type': 'keyboard', 'action': 'press', 'key': key.char if hasattr(key, 'char') else key.name, 'time': time.time()}
-                self.events.append(event)
-            except AttributeError:
-                # Special keys handling
-                event = {'type': 'keyboard', 'action': 'press', 'key': str(key), 'time': time.time()}
-                self.events.append(event)
-
-    def on_release(self, key):
-        if self.recording:
-            try:
-                event = {'type': 'keyboard', 'action': 'release', 'key': key.char if hasattr(key, 'char') else key.name, 'time': time.time()}
-                self.events.append(event)
-            except AttributeError:
-                # Special keys handling
-                event = {'type': 'keyboard', 'action': 'release', 'key': str(key), 'time': time.time()}
-                self.events.append(event)
-
-    def start(self):
+        # Listener callbacks only fill the ring buffer; a writer thread drains
+        # it into self.events, or into a journal file when one is given
+        self.capacity = capacity
+        self.batch_size = batch_size
+        self.fsync_interval = fsync_interval
+        self.poll_interval = poll_interval
+        self.use_ring(RingBuffer(capacity))
+        self.writer = None
+        self.stopping = threading.Event()
+        self.journal = None
+        self.reduction = 0.0
+        self.compaction = 0.0
+        self.instruments = None
+
+    def use_ring(self, ring):
+        # The callbacks are closures over the ring's columns rather than
+        # methods, so the hot path only touches local variables
+        self.ring = ring
+        seqs, times, actions, xs, ys, a, b = ring.seqs, ring.times, ring.actions, ring.xs, ring.ys, ring.a, ring.b
+        mask = ring.mask
+        claim = ring.seq.__next__
+        clock = perf_counter_ns
+        recorder = self
+
+        def on_click(x, y, button, pressed):
+            if recorder.recording:
+                seq = claim()
+                i = seq & mask
+                seqs[i] = -1
+                times[i] = clock()
+                actions[i] = CLICK
+                xs[i] = x
+                ys[i] = y
+                a[i] = button
+                b[i] = pressed
+                seqs[i] = seq
+
+        def on_move(x, y):
+            if recorder.recording:
+                seq = claim()
+                i = seq & mask
+                seqs[i] = -1
+                times[i] = clock()
+                actions[i] = MOVE
+                xs[i] = x
+                ys[i] = y
+                seqs[i] = seq
+
+        def on_scroll(x, y, dx, dy):
+            if recorder.recording:
+                seq = claim()
+                i = seq & mask
+                seqs[i] = -1
+                times[i] = clock()
+                actions[i] = SCROLL
+                xs[i] = x
+                ys[i] = y
+                a[i] = dx
+                b[i] = dy
+                seqs[i] = seq
+
+        def on_press(key):
+            if recorder.recording:
+                seq = claim()
+                i = seq & mask
+                seqs[i] = -1
+                times[i] = clock()
+                actions[i] = PRESS
+                a[i] = key
+                seqs[i] = seq
+
+        def on_release(key):
+            if recorder.recording:
+                seq = claim()
+                i = seq & mask
+                seqs[i] = -1
+                times[i] = clock()
+                actions[i] = RELEASE
+                a[i] = key
+                seqs[i] = seq
+
+        self.on_click, self.on_move, self.on_scroll = on_click, on_move, on_scroll
+        self.on_press, self.on_release = on_press, on_release
+
+    @property
+    def dropped(self):
+        return self.ring.dropped
+
+    def start(self, journal=None):
         self.events = []
+        self.journal = journal
+        self.use_ring(RingBuffer(self.capacity))
+        self.stopping.clear()
+        f = open(journal, 'w') if journal is not None else None
+        self.writer = threading.Thread(target=self.write_behind, args=(f,), daemon=True)
+        self.writer.start()
         self.recording = True
         self.mouse_listener = mouse.Listener(on_click=self.on_click, on_move=self.on_move, on_scroll=self.on_scroll)
         self.keyboard_listener = keyboard.Listener(on_press=self.on_press, on_release=self.on_release)
@@ -60,25 +126,72 @@ class Recorder:
             self.mouse_listener.stop()
         if self.keyboard_listener is not None:
             self.keyboard_listener.stop()
-
-    def save(self, filename):
-        with open(filename, 'w') as f:
-            json.dump(self.events, f, default=self.serialize_event)
-
-    def serialize_event(self, event):
-        # Custom serialization function to handle non-serializable objects
-        if isinstance(event['button'], mouse.Button):
-            return event['button'].name
-        elif isinstance(event['key'], keyboard.Key):
-            return event['key'].name
-        elif isinstance(event['key'], str):
-            return event['key']  # Already a string, no need to modify
-        else:
-            raise TypeError(f"Object of type {type(event)} is not JSON serializable")
+        if self.writer is not None:
+            # Only the tail still sitting in the ring needs flushing here
+            self.stopping.set()
+            self.writer.join()
+            self.writer = None
+        if self.ring.dropped:
+            # A lost release would replay as a stuck key or button, so a
+            # recording with gaps is an error rather than a warning
+            kept = f"; the events that were captured are in {self.journal}" if self.journal else ""
+            raise RuntimeError(f"{self.ring.dropped} events were lost because saving fell behind the input{kept}")
+
+    def write_behind(self, f):
+        ring = self.ring
+        instruments = self.instruments
+        if instruments is not None:
+            instruments.reset_recording()
+        last_sync = time.monotonic()
+        pending = False
+        while True:
+            stopping = self.stopping.is_set()
+            if instruments is not None:
+                depth = ring.claimed() - ring.tail
+            batch = ring.pop(self.batch_size)
+            if instruments is not None:
+                instruments.drained(depth, batch)
+            if batch:
+                if f is None:
+                    self.events.extend(batch)
+                else:
+                    f.write(''.join(json.dumps(event) + '\n' for event in batch))
+                    f.flush()
+                    pending = True
+            if pending and (stopping or time.monotonic() - last_sync >= self.fsync_interval):
+                os.fsync(f.fileno())
+                last_sync = time.monotonic()
+                pending = False
+            if len(batch) == self.batch_size:
+                continue
+            if stopping:
+                break
+            self.stopping.wait(self.poll_interval)
+        if f is not None:
+            f.close()
+        if instruments is not None:
+            instruments.recorded['recorded_dropped'] += ring.dropped
+
+    def save(self, filename, format='binary', simplify=None, normalize=False, loops=False):
+        # simplify: pixel tolerance for dropping redundant mouse moves
+        # normalize: collapse autorepeat, scroll bursts and repeated moves
+        # loops: store repeated sequences as loop blocks (JSON only)
+        if loops and format != 'json':
+            raise ValueError(f"Loop blocks can only be saved as JSON, not {format}")
+        events = self.events if self.journal is None else recfile.read_journal(self.journal)
+        if normalize:
+            events = coalesce(events)
+        if simplify is not None:
+            events, self.reduction = simplify_moves(events, simplify)
+        if loops:
+            events, self.compaction = compact_loops(events)
+        recfile.save(filename, events, format)
+        if self.journal is not None:
+            os.remove(self.journal)
+            self.journal = None
 
     def load(self, filename):
-        with open(filename, 'r') as f:
-            self.events = json.load(f)
+        self.events = recfile.load(filename)
 
 
 class Player:
@@ -0,0 +1,98 @@
+# scheduler.py
+
+import time
+
+
+class Histogram:
+    # Log-linear buckets: 8 sub-buckets per power of two, so any reported
+    # percentile is within 12.5% of the real value.
+    SUB_BUCKETS = 8
+
+    def __init__(self):
+        self.buckets = [0] * (self.SUB_BUCKETS * 64)
+        self.count = 0
+        self.total = 0
+        self.max = 0
+
+    def add(self, value):
+        if value < 0:
+            value = 0
+        shift = value.bit_length() - 4
+        if shift < 0:
+            shift = 0
+        self.buckets[shift * self.SUB_BUCKETS + (value >> shift)] += 1
+        self.count += 1
+        self.total += value
+        if value > self.max:
+            self.max = value
+
+    def bucket_bounds(self, index):
+        shift = max(index // self.SUB_BUCKETS - 1, 0)
+        mantissa = index - shift * self.SUB_BUCKETS
+        return mantissa << shift, ((mantissa + 1) << shift) - 1
+
+    def percentile(self, p):
+        if not self.count:
+            return 0
+        target = max(int(self.count * p / 100.0 + 0.5), 1)
+        seen = 0
+        for index, n in enumerate(self.buckets):
+            seen += n
+            if seen >= target:
+                return min(self.bucket_bounds(index)[1], self.max)
+        return self.max
+
+    def merge(self, other):
+        for index, n in enumerate(other.buckets):
+            self.buckets[index] += n
+        self.count += other.count
+        self.total += other.total
+        self.max = max(self.max, other.max)
+
+    def summary(self, scale=1e-6):
+        # Values are recorded in nanoseconds; the default scale reports milliseconds
+        mean = self.total / self.count if self.count else 0
+        return {
+            'count': self.count,
+            'mean': mean * scale,
+            'p50': self.percentile(50) * scale,
+            'p99': self.percentile(99) * scale,
+            'max': self.max * scale,
+        }
+
+
+class Scheduler:
+    # Coarse waits on the cancel event are kept this far from the deadline,
+    # since event timeouts can be much less precise than time.sleep()
+    CANCEL_MARGIN_NS = 16000000
+
+    def __init__(self, spin=0.002, cancel=None):
+        # Sleep until `spin` seconds before a deadline, then busy-wait the rest
+        self.spin_ns = int(spin * 1e9)
+        self.cancel = cancel
+        self.start_ns = 0
+        self.stats = Histogram()
+
+    def start(self):
+        self.start_ns = time.perf_counter_ns()
+        self.stats = Histogram()
+
+    def wait(self, offset_ns):
+        # Deadlines are absolute offsets from start(), so a late event never
+        # pushes the following ones back: the loop simply catches up.
+        # Returns the lateness in ns, or None if cancelled while waiting.
+        deadline = self.start_ns + offset_ns
+        now = time.perf_counter_ns()
+        remaining = deadline - now
+        if self.cancel is not None and remaining > self.spin_ns + self.CANCEL_MARGIN_NS:
+            if self.cancel.wait((remaining - self.spin_ns - self.CANCEL_MARGIN_NS) / 1e9):
+                return None
+            now = time.perf_counter_ns()
+            remaining = deadline - now
+        if remaining > self.spin_ns:
+            time.sleep((remaining - self.spin_ns) / 1e9)
+            now = time.perf_counter_ns()
+        while now < deadline:
+            now = time.perf_counter_ns()
+        self.stats.add(now - deadline)
+        return now - deadline
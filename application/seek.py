@@ -0,0 +1,112 @@
+# seek.py
+
+from array import array
+from bisect import bisect_left, bisect_right
+
+import recfile
+
+
+class SeekIndex:
+    # Sorted event times for bisecting, plus a checkpoint every `interval`
+    # events of what is held down and where the cursor is. The state before
+    # any event is then found from the nearest checkpoint in at most
+    # `interval` steps.
+    def __init__(self, events, interval=1024):
+        self.interval = interval
+        self.events = events
+        self.checkpoints = []
+        if isinstance(events, recfile.Recording):
+            # Bisect the mapped nanosecond column directly
+            self.times = events.columns['time']
+            self.scale = 1e9
+            self.build_columns(events)
+        else:
+            if recfile.has_loops(events):
+                # Seeking needs every event in place
+                self.events = events = list(recfile.expand_loops(events))
+            self.times = array('d')
+            self.scale = 1
+            self.build(events)
+
+    def build(self, events):
+        keys = {}
+        buttons = {}
+        position = None
+        for i, event in enumerate(events):
+            if i % self.interval == 0:
+                self.checkpoints.append((frozenset(keys), frozenset(buttons), position))
+            self.times.append(event['time'])
+            position = self.apply(event, keys, buttons, position)
+
+    def build_columns(self, recording):
+        # Same walk as build(), on the raw columns instead of event dicts
+        c = recording.columns
+        names = recording.names
+        kinds, actions, codes, pressed, xs, ys = c['kind'], c['action'], c['code'], c['pressed'], c['x'], c['y']
+        keyboard = recfile.KIND_IDS['keyboard']
+        press, release, click = recfile.ACTION_IDS['press'], recfile.ACTION_IDS['release'], recfile.ACTION_IDS['click']
+        keys = {}
+        buttons = {}
+        position = None
+        for i in range(len(recording)):
+            if i % self.interval == 0:
+                self.checkpoints.append((frozenset(keys), frozenset(buttons), position))
+            action = actions[i]
+            if kinds[i] == keyboard:
+                if action == press:
+                    keys[names[codes[i]]] = True
+                elif action == release:
+                    keys.pop(names[codes[i]], None)
+                continue
+            if action == click:
+                if pressed[i]:
+                    buttons[names[codes[i]]] = True
+                else:
+                    buttons.pop(names[codes[i]], None)
+            position = (xs[i], ys[i])
+
+    @staticmethod
+    def apply(event, keys, buttons, position):
+        if event['type'] == 'keyboard':
+            if event['action'] == 'press':
+                keys[event['key']] = True
+            elif event['action'] == 'release':
+                keys.pop(event['key'], None)
+            return position
+        if event['action'] == 'click':
+            if event['pressed']:
+                buttons[event['button']] = True
+            else:
+                buttons.pop(event['button'], None)
+        return (event['x'], event['y'])
+
+    def __len__(self):
+        return len(self.times)
+
+    @property
+    def start_time(self):
+        return self.times[0] / self.scale
+
+    def locate(self, offset):
+        # Index of the first event at or after `offset` seconds into the recording
+        if not len(self.times):
+            return 0
+        return bisect_left(self.times, self.times[0] + offset * self.scale)
+
+    def locate_end(self, offset):
+        # One past the last event at or before `offset` seconds
+        if not len(self.times):
+            return 0
+        return bisect_right(self.times, self.times[0] + offset * self.scale)
+
+    def state_at(self, index):
+        # (held keys, held buttons, cursor position) just before events[index]
+        if not self.checkpoints:
+            return frozenset(), frozenset(), None
+        checkpoint = min(index // self.interval, len(self.checkpoints) - 1)
+        keys, buttons, position = self.checkpoints[checkpoint]
+        keys = dict.fromkeys(keys, True)
+        buttons = dict.fromkeys(buttons, True)
+        for i in range(checkpoint * self.interval, index):
+            position = self.apply(self.events[i], keys, buttons, position)
+        return frozenset(keys), frozenset(buttons), position
@@ -0,0 +1,63 @@
+# worker.py
+
+import queue
+import threading
+
+
+class MacroController:
+    # Runs recording and playback off the Tk thread. Workers never touch
+    # widgets: they post (status, detail) tuples to `status`, which the GUI
+    # drains from its own main loop with after().
+    def __init__(self, recorder, player):
+        self.recorder = recorder
+        self.player = player
+        self.status = queue.Queue()
+        self.worker = None
+
+    def spawn(self, context, target, *args):
+        def run():
+            try:
+                target(*args)
+            except Exception as e:
+                self.player.playing = False
+                self.status.put(('error', f"{context}: {str(e)}"))
+
+        self.worker = threading.Thread(target=run, daemon=True)
+        self.worker.start()
+
+    def record(self, journal=None):
+        self.recorder.start(journal)
+        self.status.put(('recording', None))
+
+    def play(self, plan, repeat=1):
+        # Marked as playing before the thread starts, so an immediate stop()
+        # is not lost
+        self.player.playing = True
+        self.spawn("Error during playback", self.run_playback, self.player.play, plan, repeat)
+
+    def play_stream(self, filename, repeat=1):
+        self.player.playing = True
+        self.spawn("Error during playback", self.run_playback, self.player.play_stream, filename, 4096, repeat)
+
+    def run_playback(self, play, *args):
+        self.status.put(('playing', None))
+        play(*args)
+        self.status.put(('finished', None))
+
+    def stop(self, filename):
+        # Capture stops at once; stopping the listeners and saving happen on the worker
+        if self.recorder.recording:
+            self.recorder.recording = False
+            self.spawn("Error stopping the recording", self.save, filename)
+        elif self.player.playing:
+            self.player.stop()
+
+    def save(self, filename):
+        self.recorder.stop()
+        # The last file played may be this one, still mapped by the player or
+        # its cache; Windows refuses to overwrite a mapped file
+        self.player.close()
+        if self.player.cache is not None:
+            self.player.cache.discard(filename)
+        self.recorder.save(filename)
+        self.status.put(('saved', None))
@@ -0,0 +1,11 @@
+# conftest.py
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..', 'application'))
+
+# The stand-in controllers have to be in place before player.py is imported
+import fakeinput
+
+fakeinput.install()
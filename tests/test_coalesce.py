@@ -0,0 +1,127 @@
+# test_coalesce.py
+
+import passes
+from player import Player
+
+
+def move(x, y, time):
+    return {'type': 'mouse', 'action': 'move', 'x': x, 'y': y, 'time': time}
+
+
+def click(x, y, pressed, time, button='left'):
+    return {'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': button, 'pressed': pressed, 'time': time}
+
+
+def scroll(x, y, dy, time):
+    return {'type': 'mouse', 'action': 'scroll', 'x': x, 'y': y, 'dx': 0, 'dy': dy, 'time': time}
+
+
+def key(action, name, time):
+    return {'type': 'keyboard', 'action': action, 'key': name, 'time': time}
+
+
+def replay(events):
+    # Controller calls a fast replay issues, mouse and keyboard interleaved
+    player = Player()
+    player.fast = True
+    player.keyboard_controller.calls = player.mouse_controller.calls
+    player.play(events)
+    return player.mouse_controller.calls
+
+
+def effect(calls):
+    # What the target sees: every cursor move that goes somewhere, every
+    # button and key transition, and the wheel ticks summed between them.
+    # A press of a key that is already down is OS autorepeat, which
+    # coalesce() collapses on purpose.
+    trace = []
+    position = (0, 0)
+    held = set()
+    for name, arg in calls:
+        if name == 'position':
+            if arg == position:
+                continue
+            position = arg
+        elif name == 'scroll':
+            if trace and trace[-1][0] == 'scroll':
+                dx, dy = trace[-1][1]
+                trace[-1] = ('scroll', (dx + arg[0], dy + arg[1]))
+                continue
+        elif name == 'key_press':
+            if arg in held:
+                continue
+            held.add(arg)
+        elif name == 'key_release':
+            held.discard(arg)
+        trace.append((name, arg))
+    return trace
+
+
+def assert_replays_the_same(events, rewritten):
+    assert effect(replay(rewritten)) == effect(replay(events))
+
+
+RECORDING = [
+    move(10, 10, 0.00),
+    move(10, 10, 0.01),
+    move(20, 15, 0.02),
+    click(20, 15, True, 0.03),
+    move(20, 15, 0.04),
+    move(40, 30, 0.05),
+    click(40, 30, False, 0.06),
+    key('press', 'shift', 0.10),
+    key('press', 'a', 0.11),
+    key('press', 'a', 0.15),
+    key('press', 'a', 0.18),
+    key('release', 'a', 0.20),
+    key('release', 'shift', 0.21),
+    key('press', 'a', 0.30),
+    key('release', 'a', 0.31),
+    scroll(40, 30, -1, 0.40),
+    scroll(40, 30, -1, 0.41),
+    scroll(40, 30, -1, 0.42),
+    move(41, 30, 0.50),
+    scroll(41, 30, 2, 0.51),
+    move(41, 30, 0.52),
+]
+
+
+def test_coalesce_replays_the_same():
+    events = list(passes.coalesce(RECORDING))
+    assert_replays_the_same(RECORDING, events)
+    assert len(replay(events)) < len(replay(RECORDING))
+
+
+def test_coalesce_keeps_scrolls_at_different_spots_apart():
+    events = [move(0, 5, 0.0), scroll(0, 5, 1, 0.01), move(9, 5, 0.02), scroll(9, 5, 1, 0.03)]
+    coalesced = list(passes.coalesce(events))
+    assert len(coalesced) == len(events)
+    assert_replays_the_same(events, coalesced)
+
+
+def test_coalesce_keeps_a_move_to_where_a_scroll_was_recorded():
+    # The player scrolls where the cursor is, so the move after it is real
+    events = [move(1, 1, 0.0), scroll(5, 5, 1, 0.01), move(5, 5, 0.02), key('press', 'a', 0.03)]
+    assert_replays_the_same(events, list(passes.coalesce(events)))
+
+
+def test_coalesce_without_scroll_window():
+    events = list(passes.coalesce(RECORDING, scroll_window=None))
+    assert_replays_the_same(RECORDING, events)
+
+
+def test_dropping_a_real_move_is_detected():
+    events = [move(0, 0, 0.0), move(50, 0, 0.01), move(50, 50, 0.02), click(50, 50, True, 0.03)]
+    simplified, _ = passes.simplify_moves(events, tolerance=100, max_gap=None)
+    assert effect(replay(simplified)) != effect(replay(events))
+
+
+def test_merging_scrolls_across_a_move_is_detected():
+    events = [move(0, 5, 0.0), scroll(0, 5, 1, 0.01), move(9, 5, 0.02), scroll(9, 5, 1, 0.03)]
+    merged = [events[0], scroll(0, 5, 2, 0.01), events[2]]
+    assert effect(replay(merged)) != effect(replay(events))
+
+
+def test_dropping_a_press_after_a_release_is_detected():
+    events = [key('press', 'a', 0.0), key('release', 'a', 0.01), key('press', 'a', 0.02), key('release', 'a', 0.03)]
+    assert effect(replay(events[:2])) != effect(replay(events))
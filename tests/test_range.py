@@ -0,0 +1,58 @@
+# test_range.py
+
+from player import Player
+
+
+def move(x, y, time):
+    return {'type': 'mouse', 'action': 'move', 'x': x, 'y': y, 'time': time}
+
+
+def click(x, y, pressed, time):
+    return {'type': 'mouse', 'action': 'click', 'x': x, 'y': y, 'button': 'left', 'pressed': pressed, 'time': time}
+
+
+def key(action, name, time):
+    return {'type': 'keyboard', 'action': action, 'key': name, 'time': time}
+
+
+RECORDING = [
+    key('press', 'shift', 0.0),
+    click(10, 10, True, 0.1),
+    move(20, 20, 0.2),
+    click(20, 20, False, 0.3),
+    key('press', 'a', 0.35),
+    key('release', 'a', 0.4),
+    key('release', 'shift', 0.5),
+]
+
+
+def held_after(start, end, events=RECORDING):
+    # Keys and buttons still down once a fast replay of the range completes
+    player = Player()
+    player.fast = True
+    player.keyboard_controller.calls = player.mouse_controller.calls
+    player.play(player.compile_range(events, start, end))
+    held = set()
+    for name, arg in player.mouse_controller.calls:
+        if name in ('press', 'key_press'):
+            held.add(arg)
+        elif name in ('release', 'key_release'):
+            held.discard(arg)
+    return held
+
+
+def test_range_releases_what_it_restored_and_pressed():
+    assert held_after(0.15, 0.3) == set()
+
+
+def test_range_releases_keys_pressed_inside_the_window():
+    assert held_after(0.3, 0.38) == set()
+
+
+def test_range_past_the_last_event_releases_restored_keys():
+    # Recorded without the final release of shift
+    assert held_after(1.0, None, RECORDING[:-1]) == set()
+
+
+def test_whole_recording_leaves_nothing_held():
+    assert held_after(0.0, None) == set()
@@ -0,0 +1,89 @@
+# test_recfile.py
+
+import pytest
+
+import recfile
+
+EVENTS = [
+    {'type': 'mouse', 'action': 'move', 'x': -120, 'y': -5, 'time': 0.0},
+    {'type': 'mouse', 'action': 'click', 'x': -120, 'y': -5, 'button': 'left', 'pressed': True, 'time': 0.125},
+    {'type': 'mouse', 'action': 'click', 'x': 3840, 'y': 2160, 'button': 'left', 'pressed': False, 'time': 0.25},
+    {'type': 'mouse', 'action': 'scroll', 'x': 10, 'y': 20, 'dx': -1, 'dy': 3, 'time': 0.5},
+    {'type': 'keyboard', 'action': 'press', 'key': None, 'time': 0.75},
+    {'type': 'keyboard', 'action': 'release', 'key': None, 'time': 0.875},
+    {'type': 'keyboard', 'action': 'press', 'key': 'shift', 'time': 1.0},
+    {'type': 'keyboard', 'action': 'press', 'key': 'é', 'time': 1.001},
+    {'type': 'keyboard', 'action': 'release', 'key': 'é', 'time': 1.002},
+    {'type': 'keyboard', 'action': 'release', 'key': 'shift', 'time': 123456.789},
+]
+
+
+def assert_same_events(events, expected):
+    events = list(events)
+    assert len(events) == len(expected)
+    for event, original in zip(events, expected):
+        # Times are stored as whole nanoseconds
+        assert event.pop('time') == pytest.approx(original['time'], abs=1e-9)
+        assert event == {name: value for name, value in original.items() if name != 'time'}
+
+
+def test_write_read_round_trip(tmp_path):
+    filename = str(tmp_path / 'a.rec')
+    recfile.write(filename, EVENTS)
+    assert recfile.is_binary(filename)
+    recording = recfile.read(filename)
+    try:
+        assert_same_events(recording, EVENTS)
+        assert_same_events(recording[2:4], EVENTS[2:4])
+        assert recording[-1]['key'] == 'shift'
+    finally:
+        recording.close()
+
+
+def test_write_a_recording_back_out(tmp_path):
+    first, second = str(tmp_path / 'a.rec'), str(tmp_path / 'b.rec')
+    recfile.write(first, EVENTS)
+    recording = recfile.read(first)
+    try:
+        recfile.write(second, recording)
+    finally:
+        recording.close()
+    with open(first, 'rb') as a, open(second, 'rb') as b:
+        assert a.read() == b.read()
+
+
+def test_empty_recording(tmp_path):
+    filename = str(tmp_path / 'a.rec')
+    recfile.write(filename, [])
+    recording = recfile.read(filename)
+    assert len(recording) == 0
+    recording.close()
+
+
+def test_convert_json_to_binary_and_back(tmp_path):
+    source, binary, back = str(tmp_path / 'a.json'), str(tmp_path / 'b.rec'), str(tmp_path / 'c.json')
+    recfile.save(source, EVENTS, 'json')
+    recfile.convert(source, binary)
+    assert recfile.is_binary(binary)
+    recfile.convert(binary, back)
+    assert not recfile.is_binary(back)
+    assert_same_events(recfile.load(back), EVENTS)
+
+
+def test_loops_are_expanded_in_binary(tmp_path):
+    body = [EVENTS[6], EVENTS[9]]
+    looped = [{'type': 'loop', 'time': 1.0, 'count': 3, 'period': 2.0, 'events': body}]
+    filename = str(tmp_path / 'a.rec')
+    recfile.write(filename, looped)
+    recording = recfile.read(filename)
+    try:
+        assert_same_events(recording, list(recfile.expand_loops(looped)))
+    finally:
+        recording.close()
+
+
+def test_not_a_recording(tmp_path):
+    filename = tmp_path / 'a.rec'
+    filename.write_bytes(b'[]' + b'\x00' * 64)
+    with pytest.raises(ValueError):
+        recfile.unpack(filename.read_bytes(), str(filename))